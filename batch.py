@@ -0,0 +1,180 @@
+"""
+Play many games of hot dice at the same time.
+
+play.play plays one game at a time, rolling one roll at a time. Here, every game is a row in a set of
+NumPy arrays (turn score, remaining dice, total score, turns, busts, rolls) and each step rolls the
+dice for every unfinished game at once. Multi-player games (play.play_match) work the same way, with
+a column per player for the totals and stats, and the player whose turn it is for each game.
+
+To make that possible, the players' strategies are compiled into flat tables of decisions up front
+(see policy.py), so they have to declare what they depend on with strategy.depends_on. Players that
+already have a compiled policy use it.
+"""
+
+import numpy as np
+import policy
+from collections import namedtuple
+from policy import roll_codes, rolls_and_index, bucket
+from hotdice import Game
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES
+
+# the results of a batch of games, each is an array with one entry per game
+Games = namedtuple('Games', ['turns', 'busts', 'rolls', 'total_score'])
+
+# the results of a batch of multi-player games. winner has the index of the winning player of each
+# game, the others are arrays of (games, players)
+Matches = namedtuple('Matches', ['winner', 'turns', 'busts', 'rolls', 'total_score'])
+
+def player_policy(player, game):
+    """
+    The player's compiled policy, compiling one if it doesn't have one
+    """
+    if player.policy is not None:
+        return player.policy
+    return policy.compile_policy(player, game)
+
+def play(game, player, n_games, seed=None):
+    """
+    Play n_games games of hot dice with the player's strategies, all at the same time.
+
+    Each game is the same as a game of play.play: one player racing to game.winning_score. The player
+    object is only used for its strategies, its scores and stats are left alone.
+
+    Returns a Games tuple of arrays
+    """
+    solo = Game(winning_score=game.winning_score, players=[player])
+    matches = play_matches(solo, n_games, seed=seed)
+    return Games(matches.turns[:, 0], matches.busts[:, 0], matches.rolls[:, 0],
+                 matches.total_score[:, 0])
+
+def play_matches(game, n_matches, seed=None, first=0):
+    """
+    Play n_matches games of hot dice between game.players, all at the same time.
+
+    Each game is the same as a game of play.play_match: players take turns, starting with
+    game.players[first], until one reaches game.winning_score. If game.final_round is True, every
+    other player then gets one last turn. The highest total score wins, ties go to the player who went
+    first. The player objects are only used for their strategies.
+
+    Returns a Matches tuple of arrays
+    """
+    n_players = len(game.players)
+    policies = [player_policy(player, game) for player in game.players]
+    _, roll_index = rolls_and_index()
+
+    rng = np.random.default_rng(seed)
+
+    turn_score = np.zeros(n_matches, dtype=np.int64)
+    remaining_dice = np.full(n_matches, NUMBER_OF_DICE, dtype=np.int64)
+    # whose turn it is, and who first reached the winning score (-1 for nobody yet)
+    seat = np.full(n_matches, first, dtype=np.int64)
+    closer = np.full(n_matches, -1, dtype=np.int64)
+
+    total_score = np.zeros((n_matches, n_players), dtype=np.int64)
+    turns = np.zeros((n_matches, n_players), dtype=np.int64)
+    busts = np.zeros((n_matches, n_players), dtype=np.int64)
+    rolls = np.zeros((n_matches, n_players), dtype=np.int64)
+
+    active = np.arange(n_matches)
+    while len(active):
+        # roll every die of every unfinished game, then ignore the dice that weren't rolled
+        faces = rng.integers(1, NUMBER_OF_FACES + 1, size=(len(active), NUMBER_OF_DICE))
+        rolled = roll_index[roll_codes(faces, remaining_dice[active])]
+        seats = seat[active]
+
+        # look up the option each game's player chooses
+        scored = np.zeros(len(active), dtype=np.int64)
+        remaining = np.zeros(len(active), dtype=np.int64)
+        for n, compiled in enumerate(policies):
+            at = seats == n
+            row = bucket(turn_score[active[at]], len(compiled.option_score))
+            scored[at] = compiled.option_score[row, rolled[at]]
+            remaining[at] = compiled.option_remaining[row, rolled[at]]
+
+        # the games that bust lose their turn score
+        bust = active[scored == 0]
+        busts[bust, seat[bust]] += 1
+        turn_score[bust] = 0
+
+        # the others take the score their strategy chose
+        keep = scored != 0
+        playing = active[keep]
+        playing_seats = seats[keep]
+        turn_score[playing] += scored[keep]
+        remaining_dice[playing] = remaining[keep]
+        hotdice = remaining_dice[playing] == 0
+
+        # and choose whether to roll again
+        again = np.zeros(len(playing), dtype=bool)
+        for n, compiled in enumerate(policies):
+            at = playing_seats == n
+            row = bucket(turn_score[playing[at]], len(compiled.roll_again))
+            again[at] = compiled.roll_again[row, remaining_dice[playing[at]]]
+
+        rolling = playing[again]
+        rolls[rolling, seat[rolling]] += 1
+        remaining_dice[rolling[hotdice[again]]] = NUMBER_OF_DICE
+
+        stopping = playing[~again]
+        total_score[stopping, seat[stopping]] += turn_score[stopping]
+
+        # end the turns of the games that busted or stopped, and pass the dice to the next player
+        ended = np.concatenate([bust, stopping])
+        ended_seats = seat[ended]
+        turns[ended, ended_seats] += 1
+        turn_score[ended] = 0
+        remaining_dice[ended] = NUMBER_OF_DICE
+        reached = (closer[ended] < 0) & (total_score[ended, ended_seats] >= game.winning_score)
+        closer[ended[reached]] = ended_seats[reached]
+        seat[ended] = (ended_seats + 1) % n_players
+
+        # a game is over once somebody has reached the winning score, and, with a final round, the
+        # dice have come back around to them
+        over = closer[active] >= 0
+        if game.final_round:
+            over &= seat[active] == closer[active]
+        active = active[~over]
+
+    # the highest score wins, ties go to whoever went first (argmax takes the first of the maximums)
+    in_turn_order = np.roll(total_score, -first, axis=1)
+    winner = (np.argmax(in_turn_order, axis=1) + first) % n_players
+
+    return Matches(winner, turns, busts, rolls, total_score)
+
+def test(n_games=4000, n_batch_games=40000, seed=0, max_z=4):
+    """
+    A mini testing suite: batch.play and play.play play the same game, so with a seed each the mean
+    turns, busts and rolls of their games must agree (to within max_z standard errors)
+    """
+    import strategy
+    from play import play as play_game
+    from dice import NumpyDice
+    from hotdice import Player
+    game = Game()
+    for target_score in (300, 1000):
+        player = Player(f'{target_score}hardstop-bestper', strategy.roll_stop_at_unless_hotdice,
+                        strategy.score_best_per_dice_exclude_hot_dice,
+                        roll_kwargs={'target_score':target_score})
+        batched = play(game, player, n_batch_games, seed=seed)
+        dice = NumpyDice(seed=seed)
+        played = {'turns':[], 'busts':[], 'rolls':[]}
+        for _ in range(n_games):
+            player.reset()
+            play_game(game, player, dice=dice)
+            played['turns'].append(player.number_of_turns)
+            played['busts'].append(player.number_of_busts)
+            played['rolls'].append(player.number_of_rolls)
+
+        for name, values in played.items():
+            values, batch_values = np.array(values), getattr(batched, name)
+            error = np.hypot(values.std() / len(values) ** 0.5,
+                             batch_values.std() / len(batch_values) ** 0.5)
+            z = (values.mean() - batch_values.mean()) / error
+            assert abs(z) <= max_z, (f'target {target_score}: play.play {name} {values.mean():.3f} '
+                                     f'!= batch.play {batch_values.mean():.3f} (z={z:.1f})')
+        print('.', end='')
+    print()
+    print("All tests passed")
+
+if __name__ == '__main__':
+    test()
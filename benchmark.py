@@ -0,0 +1,200 @@
+"""
+Measure the speed of the hot path so that we notice when it gets slower.
+
+Benchmarks:
+    rolling dice with play.roll_dice and each dice source in dice.py
+    score.scores and score.options on every six dice roll
+    Player.score_choice with each score strategy in strategy.py, cached and compiled into a policy
+    games per second of play.play (with and without an instrument.Instrument), batch.play and
+    turns.play
+
+Results are saved as JSON. Give a previous results file to compare against and every benchmark that
+got slower by more than the tolerance is reported as a regression.
+
+    python benchmark.py --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import score
+import batch
+import turns
+import click
+import policy
+import platform
+import strategy
+import subprocess
+import tracemalloc
+import numpy as np
+from play import play, roll_dice
+from dice import NumpyDice, PythonDice
+from cache import DecisionCache
+from instrument import Instrument
+from hotdice import Game, Player, NUMBER_OF_DICE
+
+def commit():
+    """
+    The git commit being benchmarked, if there is one
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def score_strategies():
+    """
+    Every score strategy in strategy.py that can be used without kwargs (not the ones that need a
+    solved policy given)
+    """
+    def needs_kwargs(fn):
+        parameters = list(inspect.signature(fn).parameters.values())[3:]
+        return any(parameter.default is inspect.Parameter.empty for parameter in parameters)
+    return [fn for name, fn in vars(strategy).items()
+            if name.startswith('score_') and callable(fn) and not needs_kwargs(fn)]
+
+def bench_calls(fn, args, repeat=5):
+    """
+    Call fn on each of args, repeat times. Returns the time per call of the fastest repeat, and the
+    peak memory allocated per call while calling it (measured separately, tracing slows things down)
+    """
+    fn(*args[0])
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for arg in args:
+            fn(*arg)
+        times.append((time.perf_counter() - start) / len(args))
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for arg in args:
+        fn(*arg)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {'calls':len(args), 'per_call_us':min(times) * 1e6, 'peak_bytes_per_call':peak / len(args)}
+
+def bench_games(fn, n_games):
+    """
+    Time fn, which plays n_games games. Returns the games per second
+    """
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {'games':n_games, 'games_per_second':n_games / elapsed}
+
+def run(n_games=200, n_batch_games=20000, repeat=5, seed=0):
+    """
+    Run every benchmark. Returns a dictionary of benchmark name: measurements
+    """
+    # load the scoring table before timing anything
+    score.score_table()
+    rolls = [(roll,) for roll in score.all_rolls(NUMBER_OF_DICE)]
+    game = Game()
+
+    results = {}
+    dice_counts = [(n,) for n in range(1, NUMBER_OF_DICE + 1)] * 100
+    results['play.roll_dice'] = bench_calls(roll_dice, dice_counts, repeat=repeat)
+    results['dice.NumpyDice'] = bench_calls(NumpyDice(seed=seed).roll, dice_counts, repeat=repeat)
+    results['dice.PythonDice'] = bench_calls(PythonDice(seed=seed).roll, dice_counts, repeat=repeat)
+
+    results['score.scores'] = bench_calls(score.scores, rolls, repeat=repeat)
+    results['score.options'] = bench_calls(score.options, rolls, repeat=repeat)
+
+    choices = [(game, score.options(roll), roll) for roll, in rolls]
+    choices = [choice for choice in choices if len(choice[1])]
+    for score_strategy in score_strategies():
+        player = Player('benchmark', strategy.roll_stop_at_unless_hotdice, score_strategy,
+                        roll_kwargs={'target_score':400})
+        results[f'score_choice.{score_strategy.__name__}'] = bench_calls(player.score_choice, choices,
+                                                                         repeat=repeat)
+        player.decision_cache = DecisionCache()
+        results[f'score_choice.{score_strategy.__name__}.cached'] = bench_calls(player.score_choice,
+                                                                                choices, repeat=repeat)
+        player.decision_cache = None
+        try:
+            player.policy = policy.compile_policy(player, game)
+        except ValueError:
+            # the strategy depends on state that a policy can't (e.g. the total score)
+            continue
+        results[f'score_choice.{score_strategy.__name__}.policy'] = bench_calls(player.score_choice,
+                                                                                choices, repeat=repeat)
+
+    player = Player('benchmark', strategy.roll_stop_at_unless_hotdice,
+                    strategy.score_best_per_dice_exclude_hot_dice, roll_kwargs={'target_score':400})
+
+    def play_games(instrument=None):
+        dice = NumpyDice(seed=seed)
+        for _ in range(n_games):
+            player.reset()
+            play(game, player, dice=dice, instrument=instrument)
+
+    results['play.play'] = bench_games(play_games, n_games)
+    results['play.play.instrumented'] = bench_games(lambda: play_games(Instrument()), n_games)
+    results['batch.play'] = bench_games(lambda: batch.play(game, player, n_batch_games, seed=seed),
+                                        n_batch_games)
+    # the turn outcomes are worked out once per strategy, so only time the games
+    turns.player_sampler(player, game)
+    results['turns.play'] = bench_games(lambda: turns.play(game, player, n_batch_games, seed=seed),
+                                        n_batch_games)
+    return results
+
+def compare(before, after, tolerance=0.2):
+    """
+    Compare two sets of benchmark results. Returns the names of the benchmarks that got slower by more
+    than tolerance (a fraction)
+    """
+    regressions = []
+    for name, result in after.items():
+        if name not in before:
+            print(f'{name:<55} (new)')
+            continue
+        if 'per_call_us' in result:
+            old, new = before[name]['per_call_us'], result['per_call_us']
+            slower = new / old - 1
+            unit = 'us/call'
+        else:
+            old, new = before[name]['games_per_second'], result['games_per_second']
+            slower = old / new - 1
+            unit = 'games/s'
+        flag = 'REGRESSION' if slower > tolerance else ''
+        print(f'{name:<55} {old:>12.1f} -> {new:>12.1f} {unit:<8} {slower:+7.1%} {flag}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+@click.command()
+@click.option('--output', type=click.Path(), default=None, help='Save the results to this JSON file')
+@click.option('--compare', 'previous', type=click.Path(exists=True), default=None,
+              help='Compare against the results in this JSON file')
+@click.option('--tolerance', default=0.2, help='How much slower (a fraction) counts as a regression')
+@click.option('--games', default=200, help='Games of play.play to time')
+def main(output, previous, tolerance, games):
+    results = run(n_games=games)
+    report = {'commit':commit(), 'python':platform.python_version(), 'numpy':np.__version__,
+              'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'results':results}
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if previous is None:
+        for name, result in results.items():
+            print(f'{name:<55} ' + ', '.join(f'{key}={value:.1f}' if isinstance(value, float) 
+                                             else f'{key}={value}' for key, value in result.items()))
+        return
+
+    with open(previous) as f:
+        before = json.load(f)
+    print(f'Comparing {before.get("commit")} -> {report["commit"]}')
+    if compare(before['results'], results, tolerance=tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
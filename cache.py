@@ -0,0 +1,114 @@
+"""
+Remember the decisions of score strategies.
+
+For a fixed strategy and kwargs, the option a player chooses only depends on the roll (or rather, its
+options) and the bits of player state the strategy declares with strategy.depends_on. So once a choice
+has been made, it can be looked up instead of asking the strategy again. Players can share a cache, so
+decisions are kept by the strategy and kwargs that made them too (see decision_key).
+"""
+
+from collections import namedtuple, OrderedDict
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class Identity():
+    """
+    A kwarg that can't be hashed (e.g. a policy of arrays), compared by identity instead. It keeps the
+    value alive, so its id can't be reused while a decision is cached under it
+    """
+    __slots__ = ['value']
+
+    def __init__(s, value):
+        s.value = value
+
+    def __hash__(s):
+        return id(s.value)
+
+    def __eq__(s, other):
+        return isinstance(other, Identity) and s.value is other.value
+
+def hashable(value):
+    """
+    The value, or its Identity if it can't be hashed
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return Identity(value)
+    return value
+
+def decision_key(strategy, kwargs, state):
+    """
+    The state to cache a decision under: the strategy, its kwargs (by identity if they can't be
+    hashed), and the player state it depends on
+
+    >>> decision_key(len, {'b': 2, 'a': 1}, (50,)) == decision_key(len, {'a': 1, 'b': 2}, (50,))
+    True
+    >>> policy = [1, 2]
+    >>> decision_key(len, {'policy': policy}, ()) == decision_key(len, {'policy': policy}, ())
+    True
+    >>> decision_key(len, {'policy': policy}, ()) == decision_key(len, {'policy': [1, 2]}, ())
+    False
+    """
+    return (strategy, tuple(sorted((name, hashable(value)) for name, value in kwargs.items())),
+            state)
+
+class DecisionCache():
+    """
+    A bounded cache of the index of the option chosen for a tuple of options and some player state.
+    The least recently used decision is dropped when the cache is full.
+
+    Options tuples from the scoring table live as long as the table, so they are keyed by identity,
+    which is much cheaper than hashing them. The options are kept with the decision, so an options
+    tuple can't be garbage collected (and its id reused) while its decision is cached.
+
+    >>> cache = DecisionCache(maxsize=1)
+    >>> options, other = ('a', 'b'), ('c',)
+    >>> cache.get(options, ()) is None
+    True
+    >>> cache.put(options, (), 1)
+    >>> cache.get(options, ())
+    1
+    >>> cache.put(other, (), 0)
+    >>> cache.get(options, ()) is None
+    True
+    >>> cache.info()
+    CacheInfo(hits=1, misses=2, maxsize=1, currsize=1)
+    """
+    def __init__(s, maxsize=4096):
+        s.maxsize = maxsize
+        s.decisions = OrderedDict()
+        s.hits = 0
+        s.misses = 0
+
+    def get(s, options, state):
+        """
+        The cached decision for options in state, or None
+        """
+        try:
+            cached_options, decision = s.decisions[id(options), state]
+        except KeyError:
+            s.misses += 1
+            return None
+        s.decisions.move_to_end((id(options), state))
+        s.hits += 1
+        return decision
+
+    def put(s, options, state, decision):
+        """
+        Remember the decision for options in state
+        """
+        s.decisions[id(options), state] = (options, decision)
+        if len(s.decisions) > s.maxsize:
+            s.decisions.popitem(last=False)
+
+    def info(s):
+        return CacheInfo(s.hits, s.misses, s.maxsize, len(s.decisions))
+
+    def clear(s):
+        """
+        Forget every decision and reset the counters
+        """
+        s.decisions.clear()
+        s.hits = 0
+        s.misses = 0
@@ -0,0 +1,12 @@
+"""
+The constants of the game, in a module that imports nothing.
+
+Every other module takes its constants from here, so importing one module doesn't import all the others
+(and their dependencies) along with it. hotdice re-exports them for backwards compatibility.
+"""
+
+NUMBER_OF_DICE = 6
+NUMBER_OF_FACES = 6
+MIN_REPEAT_MULTIPLES = 3
+# the columns of the results of hotdice.main, one row per game
+COLUMNS = ['Name', 'Target', 'RollStrat', 'ScoreStrat', 'Turns', 'Busts', 'Rolls']
@@ -0,0 +1,72 @@
+"""
+Sources of dice rolls.
+
+Calling np.random.randint for every roll of one to six dice spends nearly all of its time on NumPy's
+per-call overhead. A dice source instead draws a big block of faces at once and hands out slices of it.
+
+Every dice source has a roll(n) method that returns a tuple of n faces. Give a seed to make a run
+reproducible.
+"""
+
+import random
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES
+
+class NumpyDice():
+    """
+    Dice drawn in blocks from a seeded np.random.Generator
+
+    >>> NumpyDice(seed=1).roll(3) == NumpyDice(seed=1).roll(3)
+    True
+    """
+    def __init__(s, seed=None, block_size=1 << 16, face=NUMBER_OF_FACES):
+        # imported here so that importing dice (and play) doesn't import NumPy until it's needed
+        import numpy as np
+        s.rng = np.random.default_rng(seed)
+        s.block_size = block_size
+        s.face = face
+        s.refill()
+
+    def refill(s):
+        """
+        Draw the next block of faces. The faces are kept as a list so that slices of it are tuples of
+        Python ints, which are much faster to work with than NumPy scalars
+        """
+        s.block = s.rng.integers(1, s.face + 1, s.block_size).tolist()
+        s.position = 0
+
+    def roll(s, n=NUMBER_OF_DICE):
+        "Roll n dice"
+        end = s.position + n
+        if end > s.block_size:
+            s.refill()
+            end = n
+        roll = tuple(s.block[s.position:end])
+        s.position = end
+        return roll
+
+class PythonDice():
+    """
+    Dice from Python's random module, for when NumPy isn't wanted
+
+    >>> PythonDice(seed=1).roll(3) == PythonDice(seed=1).roll(3)
+    True
+    """
+    def __init__(s, seed=None, face=NUMBER_OF_FACES):
+        s.random = random.Random(seed)
+        s.faces = range(1, face + 1)
+
+    def roll(s, n=NUMBER_OF_DICE):
+        "Roll n dice"
+        return tuple(s.random.choices(s.faces, k=n))
+
+# the dice used when none are given, made the first time they are needed
+DEFAULT_DICE = None
+
+def default_dice():
+    """
+    The (unseeded) dice to use when no dice were given
+    """
+    global DEFAULT_DICE
+    if DEFAULT_DICE is None:
+        DEFAULT_DICE = NumpyDice()
+    return DEFAULT_DICE
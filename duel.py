@@ -0,0 +1,371 @@
+"""
+Work out how to play to win a two player game, not just to finish quickly.
+
+In a head to head game what matters is the probability of winning, which depends on both players'
+totals. A state is (my total, opponent's total, whether I went first, turn score, dice), with every
+score in SCORE_UNITs. In each state the player can stop, after which the opponent plays from
+(their total, my new total), or roll. A bust also hands the dice over, with the totals unchanged.
+
+Stopping always makes the sum of the totals bigger, so the states are solved in layers of the sum of
+the totals, from the biggest down. Within a layer the only links are busts, which go from
+(a, b) to the opponent's (b, a). Every state's probability of winning is linear in the value of a bust
+(c + d * bust), so for fixed decisions the two start of turn values of (a, b) and (b, a) are the
+solution of two linear equations. As in solver.solve_game, a sweep makes the best decisions for the
+current guess of the bust values, the equations give the exact values of those decisions, and that is
+repeated until the values stop changing.
+
+To keep the sweeps cheap, the rolls are reduced first (see profiles): a higher turn score with the same
+number of dice is never worse, so of the options of a roll only the best score for each number of
+dice left matters, and rolls that leave the same choices are merged.
+
+With final_round, the player who didn't reach the winning score gets one last turn, where all that
+matters is scoring enough to pass the closer (see reach_table). Ties go to the player who went first.
+So it can be worth rolling on after reaching the winning score, to leave the other player more to
+make up. That is solved too, up to overshoot points past the winning score, where the player stops.
+
+The solution can be written to a directory of .npy files and opened with load, memory mapped, so that
+many processes can share a single copy. Play it with strategy.roll_win_most and score_win_most.
+
+Solving takes a while: about half a minute to 2000 and 6 minutes to 5000, growing with the cube of
+the winning score, so give a 10000 game processes and an output directory (its values are 600MB).
+"""
+
+import os
+import numpy as np
+import solver
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from score import SCORE_UNIT
+from core import NUMBER_OF_DICE
+
+# the rolls of every number of dice, with rolls that leave the same choices merged (see profiles)
+# probability - of each (merged) roll
+# rolled - the number of dice rolled
+# starts, score, dice - as for solver.Transitions
+Profiles = namedtuple('Profiles', ['probability', 'rolled', 'starts', 'score', 'dice'])
+
+# the solution of a two player game. The states of the arrays are [my total, opponent's total,
+# whether I went first, turn score, dice - 1], totals and turn score in SCORE_UNITs. Only the turn 
+# scores up to the winning score plus the overshoot are solved (the rest of the rows are 0)
+# win - the probability of winning at the start of a turn, [my total, opponent's total, first]
+# roll_again - whether rolling wins more often than stopping
+# value - the probability of winning, playing optimally (None if it wasn't kept)
+# reach - the probability of scoring at least k more this turn with n dice, [k, n], when that is all
+#         that matters (the last turn of the final round)
+DuelPolicy = namedtuple('DuelPolicy', ['winning_score', 'final_round', 'overshoot', 'win',
+                                       'roll_again', 'value', 'reach'])
+
+def profiles():
+    """
+    Every roll of 1 to NUMBER_OF_DICE dice, reduced to the best score for each number of dice left,
+    with the rolls that leave the same choices merged. Returns Profiles
+    """
+    moves, rolled = solver.all_transitions()
+    ends = np.append(moves.starts, len(moves.score))
+    merged = {}
+    for r in range(len(moves.starts)):
+        best = {}
+        for points, dice in zip(moves.score[ends[r]:ends[r + 1]], moves.dice[ends[r]:ends[r + 1]]):
+            best[dice] = max(best.get(dice, 0), points)
+        key = (rolled[r], tuple(sorted(best.items())))
+        merged[key] = merged.get(key, 0) + moves.probability[r]
+
+    probability, rolls, starts, scores, dice = [], [], [], [], []
+    for (n, choices), p in merged.items():
+        probability.append(p)
+        rolls.append(n)
+        starts.append(len(scores))
+        for left, points in choices:
+            scores.append(points)
+            dice.append(left)
+    return Profiles(np.array(probability), np.array(rolls), np.array(starts), np.array(scores),
+                    np.array(dice))
+
+def reach_table(size, rolls):
+    """
+    The probability of scoring at least k more units this turn, playing only for that, starting with n
+    dice. Returns an array [k, n] for k from 0 to size (k = 0 is certain)
+    """
+    segment = np.repeat(np.arange(len(rolls.starts)), np.diff(np.append(rolls.starts,
+                                                                          len(rolls.score))))
+    reach = np.zeros((size + 1, NUMBER_OF_DICE + 1))
+    reach[0] = 1
+    for k in range(1, size + 1):
+        # reaching it with this roll is certain, otherwise take the best chance of the rest
+        left = reach[np.maximum(k - rolls.score, 0), rolls.dice]
+        best = np.maximum.reduceat(left, rolls.starts)
+        reach[k] = np.bincount(rolls.rolled, rolls.probability * best, NUMBER_OF_DICE + 1)
+    return reach
+
+def padded(rolls):
+    """
+    The options of the Profiles as arrays [roll, option] of score and dice left, every roll padded to
+    the same number of options by repeating its last one (which never changes the first best option)
+    """
+    ends = np.append(rolls.starts, len(rolls.score))
+    width = np.diff(ends).max()
+    index = np.minimum(rolls.starts[:, None] + np.arange(width), ends[1:, None] - 1)
+    return rolls.score[index], rolls.dice[index]
+
+# filled in the first time a process needs them
+PROFILES, REACH = None, {}
+# the most units a single roll can score (six 1s), which bounds how far past a state a roll can go
+PROFILES_LARGEST = 8 * 1000 // SCORE_UNIT
+
+def constants(size):
+    """
+    The Profiles and a reach table of at least size units, made once per process
+    """
+    global PROFILES
+    if PROFILES is None:
+        PROFILES = profiles()
+    if size not in REACH:
+        REACH[size] = reach_table(size, PROFILES)
+    return PROFILES, REACH[size]
+
+def sweep(task):
+    """
+    Make the best decisions for a chunk of the states of a layer, given the value of busting in each.
+
+    task is (goal, extra, final_round, mine, theirs, first, bust_value, win):
+    goal - the winning score, in units
+    extra - the overshoot, in units
+    mine, theirs, first - arrays of the totals and who went first of every state in the chunk
+    bust_value - the probability of winning after busting (1 - the opponent's start of turn value)
+    win - the start of turn values of every state solved so far
+
+    Returns (c, d) at the start of turn (the probability of winning is c + d * bust_value), and the
+    value and roll_again blocks of the states
+    """
+    goal, extra, final_round, mine, theirs, first, bust_value, win = task
+    rolls, reach = constants(2 * goal + extra + PROFILES_LARGEST)
+    score, dice = padded(rolls)
+    bust = 1 - np.bincount(rolls.rolled, rolls.probability, NUMBER_OF_DICE + 1)
+    bust[0] = 0
+    by_dice = np.zeros((len(rolls.probability), NUMBER_OF_DICE + 1))
+    by_dice[np.arange(len(rolls.probability)), rolls.rolled] = rolls.probability
+
+    rolled = np.arange(len(rolls.starts))
+    largest = rolls.score.max()
+    after = score * (NUMBER_OF_DICE + 1) + dice
+    rows = goal - mine + extra
+    size = goal + extra + largest + 1
+
+    # stopping with a turn score that reaches the winning score ends the game unless there's a final 
+    # round, and past the overshoot the player stops
+    total = mine[:, None] + np.arange(size)
+    closing = np.ones((len(mine), size))
+    if final_round:
+        # the opponent has to pass the closer (or tie, if they went first)
+        need = np.clip(total - theirs[:, None] + first[:, None], 0, len(reach) - 1)
+        closing = 1 - reach[need, NUMBER_OF_DICE]
+    c = np.repeat(closing[:, :, None], NUMBER_OF_DICE + 1, axis=2)
+    d = np.zeros_like(c)
+    roll_again = np.zeros((len(mine), goal + extra, NUMBER_OF_DICE + 1), dtype=bool)
+
+    for t in range(rows.max() - 1, -1, -1):
+        playing = t < rows
+        # the states a roll can lead to, flattened so that each option is a single column
+        c_after = c[:, t:t + largest + 1].reshape(len(mine), -1)
+        d_after = d[:, t:t + largest + 1].reshape(len(mine), -1)
+        values = np.take(c_after + d_after * bust_value[:, None], after, axis=1)
+        chosen = after[rolled, np.argmax(values, axis=2)]
+        roll_c = np.take_along_axis(c_after, chosen, axis=1) @ by_dice
+        roll_d = np.take_along_axis(d_after, chosen, axis=1) @ by_dice + bust
+
+        # stopping hands the dice to the opponent with my new total
+        banked = np.minimum(mine + t, goal - 1)
+        stop = np.where(mine + t < goal, 1 - win[theirs, banked, 1 - first], closing[:, t])
+        rolls_again = (roll_c + roll_d * bust_value[:, None] > stop[:, None]) | (t == 0)
+        c[playing, t] = np.where(rolls_again, roll_c, stop[:, None])[playing]
+        d[playing, t] = np.where(rolls_again, roll_d, 0)[playing]
+        roll_again[playing, t] = rolls_again[playing]
+
+    value = c[:, :goal + extra, 1:] + d[:, :goal + extra, 1:] * bust_value[:, None, None]
+    value[np.arange(goal + extra) >= rows[:, None]] = 0
+    return (c[:, 0, NUMBER_OF_DICE], d[:, 0, NUMBER_OF_DICE], value.astype(np.float32),
+            roll_again[:, :, 1:])
+
+def chunks(n, processes):
+    """
+    Split range(n) into a slice per process
+    """
+    bounds = np.linspace(0, n, processes + 1).astype(int)
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def solve(winning_score=10000, final_round=True, overshoot=5000, output=None, values=True,
+          processes=1, tolerance=1e-10, max_iterations=100, verbose=False):
+    """
+    Find the policy that maximizes the probability of winning a two player game. Returns a DuelPolicy
+
+    Arguments:
+    winning_score - the score to reach
+    final_round - whether the other player gets a last turn after one reaches the winning score
+    overshoot - how far past the winning score a player might roll on, with a final round (the 
+                chance of the other player making up the default 5000 in a turn is about 0.1%)
+    output - a directory to write the policy to (memory mapped while solving, so the full policy never
+             has to fit in memory), None to keep it in memory
+    values - keep the probability of winning of every state (needed to choose scores, it's 4 times
+             the size of roll_again)
+    processes - split the states of each layer between this many processes
+    tolerance, max_iterations - when to stop iterating within a layer
+    """
+    goal = -(-winning_score // SCORE_UNIT)
+    extra = overshoot // SCORE_UNIT if final_round else 0
+    shape = (goal, goal, 2, goal + extra, NUMBER_OF_DICE)
+    rolls, reach = constants(2 * goal + extra + PROFILES_LARGEST)
+
+    def array(name, dtype, shape):
+        if output is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(output, f'{name}.npy'), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    win = np.zeros((goal, goal, 2))
+    roll_again = array('roll_again', bool, shape)
+    value = array('value', np.float32, shape) if values else None
+
+    pool = ProcessPoolExecutor(processes) if processes > 1 else None
+    try:
+        for layer in range(2 * goal - 2, -1, -1):
+            mine = np.repeat(np.arange(max(0, layer - goal + 1), min(goal - 1, layer) + 1), 2)
+            theirs = layer - mine
+            first = np.tile([0, 1], len(mine) // 2)
+            # the state a bust hands the dice to, (b, a) with the other player first
+            partner = np.searchsorted(mine * 2 + first, theirs * 2 + 1 - first)
+            parts = chunks(len(mine), processes)
+
+            def run(bust_value):
+                tasks = [(goal, extra, final_round, mine[part], theirs[part], first[part],
+                          bust_value[part], win) for part in parts]
+                results = list(pool.map(sweep, tasks) if pool else map(sweep, tasks))
+                return [np.concatenate(arrays) for arrays in zip(*results)]
+
+            # start from the layer above, one more point for the opponent
+            x = win[mine, np.minimum(theirs + 1, goal - 1), first]
+            for iteration in range(1, max_iterations + 1):
+                c, d, state_value, state_roll_again = run(1 - x[partner])
+                # x = c + d (1 - x[partner]) for every state, with these decisions
+                cp, dp = c[partner], d[partner]
+                updated = (c + d - d * cp - d * dp) / (1 - d * dp)
+                change = np.abs(updated - x).max()
+                x = updated
+                if change <= tolerance:
+                    break
+
+            win[mine, theirs, first] = x
+            roll_again[mine, theirs, first] = state_roll_again
+            if values:
+                value[mine, theirs, first] = state_value
+            if verbose and layer % 20 == 0:
+                print(f'layer {layer}: {iteration} iterations, change {change:.1e}')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if output is not None:
+        np.save(os.path.join(output, 'win.npy'), win)
+        np.save(os.path.join(output, 'reach.npy'), reach)
+        np.save(os.path.join(output, 'rules.npy'), np.array([winning_score, final_round, 
+                                                             overshoot if final_round else 0]))
+        for array in (roll_again, value):
+            if array is not None:
+                array.flush()
+    return DuelPolicy(winning_score, final_round, overshoot if final_round else 0, win, roll_again,
+                      value, reach)
+
+def load(directory):
+    """
+    Open a policy written by solve, memory mapped
+    """
+    def open_array(name):
+        path = os.path.join(directory, f'{name}.npy')
+        return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+    winning_score, final_round, overshoot = np.load(os.path.join(directory, 'rules.npy'))
+    return DuelPolicy(int(winning_score), bool(final_round), int(overshoot), open_array('win'),
+                      open_array('roll_again'), open_array('value'), open_array('reach'))
+
+def opponent(player, game):
+    """
+    The opponent's total score in a two player game (game.players), and whether player went first. 
+    Returns (opponent_total, first)
+    """
+    other, = [p for p in game.players if p is not player]
+    # on the first player's turns both have had the same number of turns
+    return other.total_score, player.number_of_turns == other.number_of_turns
+
+def last_turn_need(policy, total, opponent_total, first):
+    """
+    The units a player needs to score in the last turn of the final round to beat the closer
+    """
+    return (opponent_total - total) // SCORE_UNIT + (0 if first else 1)
+
+def duel_roll_again(policy, total, opponent_total, first, turn_score, dice):
+    """
+    Whether the policy rolls again. dice is the number of dice left, 0 for hot dice
+    """
+    if opponent_total >= policy.winning_score:
+        # the last turn: keep going until the closer is passed
+        return turn_score // SCORE_UNIT < last_turn_need(policy, total, opponent_total, first)
+    a, t = total // SCORE_UNIT, turn_score // SCORE_UNIT
+    if t >= policy.roll_again.shape[3] - a or (a + t >= policy.win.shape[0] and not policy.final_round):
+        return False
+    return bool(policy.roll_again[a, opponent_total // SCORE_UNIT, int(first), t,
+                                  (dice or NUMBER_OF_DICE) - 1])
+
+def duel_value(policy, total, opponent_total, first, turn_score, dice):
+    """
+    The probability of winning in a state, playing optimally. dice is the number of dice left, 0 for
+    hot dice
+    """
+    dice = dice or NUMBER_OF_DICE
+    if opponent_total >= policy.winning_score:
+        need = last_turn_need(policy, total, opponent_total, first) - turn_score // SCORE_UNIT
+        return float(policy.reach[min(max(need, 0), len(policy.reach) - 1), dice])
+    a, b, t = total // SCORE_UNIT, opponent_total // SCORE_UNIT, turn_score // SCORE_UNIT
+    goal = policy.win.shape[0]
+    if a + t >= goal and not policy.final_round:
+        return 1.0
+    if t >= policy.roll_again.shape[3] - a:
+        # past the overshoot the player stops
+        need = min(a + t - b + int(first), len(policy.reach) - 1)
+        return float(1 - policy.reach[need, NUMBER_OF_DICE])
+    return float(policy.value[a, b, int(first), t, dice - 1])
+
+def test(winning_score=500, n_matches=4000, seed=0, max_z=4):
+    """
+    A mini testing suite: solve a short game, every probability must be a probability, and two
+    players playing the policy against each other must win as often as it says the first player does
+    (to within max_z standard errors)
+    """
+    import play
+    import strategy
+    from dice import NumpyDice
+    from hotdice import Game, Player
+
+    policy = solve(winning_score)
+    for name in ('win', 'value', 'reach'):
+        array = getattr(policy, name)
+        assert 0 <= array.min() and array.max() <= 1, f'{name} is not a probability'
+    first_wins = float(policy.win[0, 0, 1])
+    start = duel_value(policy, 0, 0, True, 0, NUMBER_OF_DICE)
+    assert abs(start - first_wins) < 1e-6, f'duel_value {start} != win {first_wins}'
+    print('.', end='')
+
+    players = [Player(name, strategy.roll_win_most, strategy.score_win_most,
+                      roll_kwargs={'policy':policy}, score_kwargs={'policy':policy})
+               for name in ('first', 'second')]
+    game = Game(winning_score=winning_score, players=players)
+    dice = NumpyDice(seed=seed)
+    played = sum(play.play_match(game, 0, dice) == 0 for _ in range(n_matches)) / n_matches
+    z = (played - first_wins) / (first_wins * (1 - first_wins) / n_matches) ** 0.5
+    assert abs(z) <= max_z, f'the first player won {played:.4f} of matches, not {first_wins:.4f}'
+    print('.', end='')
+    print()
+    print("All tests passed")
+
+if __name__ == '__main__':
+    policy = solve(2000, verbose=True)
+    print(f'Probability that the first player wins to 2000: {policy.win[0, 0, 1]:.4f}')
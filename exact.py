@@ -0,0 +1,121 @@
+"""
+Work out the distribution of the number of turns to win exactly, instead of playing games.
+
+With a strategy that plays every turn the same way (see turns.py), every turn banks a number of points
+drawn from the same distribution, so the total after n turns is the n-fold convolution of that
+distribution. Convolving turn after turn, and taking out the totals that have reached the winning
+score, gives the probability of every number of turns to win (turns_to_win), until less than tolerance
+of the probability is left.
+
+The mean and variance don't even need that: the expected turns left (and their square) from each
+total only depend on those from bigger totals, and the total itself (a bust), so they can be solved
+exactly from the winning score down (moments).
+
+main gives exact answers for the players of hotdice.main, in the same columns as stats.Aggregator's
+summaries of simulated games.
+"""
+
+import turns
+import batch
+import strategy
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from hotdice import Game, Player, TARGETS
+from score import SCORE_UNIT
+
+# the distribution of the number of turns to win
+# pmf - the probability of winning in exactly n turns, for n from 0
+# mean, variance - of the number of turns (exact, see moments)
+# tail - the probability of taking more than len(pmf) - 1 turns, which was left out of pmf
+TurnsToWin = namedtuple('TurnsToWin', ['pmf', 'mean', 'variance', 'tail'])
+
+def banked_distribution(outcomes):
+    """
+    The probability of banking each number of SCORE_UNITs in a turn (0 for a bust), from the
+    turns.TurnOutcomes of a strategy
+    """
+    return np.bincount(outcomes.banked // SCORE_UNIT, outcomes.probability)
+
+def moments(banked, goal):
+    """
+    The exact mean and variance of the number of turns to bank goal units, turn after turn
+
+    >>> moments(np.array([0.5, 0.5]), 1)
+    (2.0, 2.0)
+    """
+    # expected turns and expected squared turns left from every total, 0 once the goal is reached
+    mean = np.zeros(goal + len(banked))
+    square = np.zeros(goal + len(banked))
+    for total in range(goal - 1, -1, -1):
+        after = slice(total + 1, total + len(banked))
+        # N = 1 + N' where N' is from the total after this turn, which is this total after a bust
+        mean[total] = (1 + banked[1:] @ mean[after]) / (1 - banked[0])
+        square[total] = (1 + 2 * (banked[0] * mean[total] + banked[1:] @ mean[after])
+                         + banked[1:] @ square[after]) / (1 - banked[0])
+    return float(mean[0]), float(square[0] - mean[0] ** 2)
+
+def turns_to_win(banked, winning_score, tolerance=1e-12, max_turns=100_000):
+    """
+    The distribution of the number of turns to reach winning_score, banking banked (see
+    banked_distribution) every turn. Returns TurnsToWin
+
+    >>> result = turns_to_win(np.array([0.5, 0.5]), SCORE_UNIT)
+    >>> [float(p) for p in result.pmf[:4]], result.mean
+    ([0.0, 0.5, 0.25, 0.125], 2.0)
+    """
+    goal = -(-winning_score // SCORE_UNIT)
+    # the probability of every total that hasn't reached the winning score yet
+    playing = np.zeros(goal)
+    playing[0] = 1
+    pmf = [0.0]
+    while playing.sum() >= tolerance and len(pmf) <= max_turns:
+        after = np.convolve(playing, banked)
+        pmf.append(playing.sum() - after[:goal].sum())
+        playing = after[:goal]
+    return TurnsToWin(np.array(pmf), *moments(banked, goal), float(playing.sum()))
+
+def quantile(result, q):
+    """
+    The smallest number of turns that at least a fraction q of games are won in (None if that's
+    in the tail)
+
+    >>> quantile(turns_to_win(np.array([0.5, 0.5]), SCORE_UNIT), 0.5)
+    1
+    """
+    cumulative = np.cumsum(result.pmf)
+    if cumulative[-1] < q:
+        return None
+    return int(np.searchsorted(cumulative, q))
+
+def player_turns_to_win(player, game, tolerance=1e-12):
+    """
+    The TurnsToWin of a player (with strategies that can be compiled, see policy.py)
+    """
+    outcomes = turns.turn_outcomes(batch.player_policy(player, game))
+    return turns_to_win(banked_distribution(outcomes), game.winning_score, tolerance)
+
+def main(targets=TARGETS, winning_score=10000, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """
+    The exact turns to win of the players of hotdice.main, as a DataFrame with a row per target and
+    the Turns columns of stats.Aggregator.to_frame (and Turns.Var)
+    """
+    game = Game(winning_score=winning_score)
+    rows = []
+    for target_score in targets:
+        player = Player(f'{target_score}hardstop-bestper', strategy.roll_stop_at_unless_hotdice,
+                        strategy.score_best_per_dice_exclude_hot_dice,
+                        roll_kwargs={'target_score':target_score})
+        result = player_turns_to_win(player, game)
+        row = {'Name':player.name, 'Target':target_score,
+               'RollStrat':player.roll_strategy.__name__,
+               'ScoreStrat':player.score_strategy.__name__,
+               'Turns.Mean':result.mean, 'Turns.Var':result.variance,
+               'Turns.Std':result.variance ** 0.5}
+        for q in quantiles:
+            row[f'Turns.Q{round(100 * q):02d}'] = quantile(result, q)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    print(main().to_string())
@@ -13,37 +13,48 @@ What we'll need is:
     a way to select between strategies
 """
 
-# CONSTANTS
+# CONSTANTS (defined in core, which imports nothing, and re-exported here)
 # ---------
-NUMBER_OF_DICE = 6
-NUMBER_OF_FACES = 6
-MIN_REPEAT_MULTIPLES = 3
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES, COLUMNS
 
 import play
 import strategy
-import numpy as np
-import pandas as pd
+from cache import decision_key
 
 # make this an autobuilder
 class Game():
     """
     Defines our game object, which includes all of our game attributes like number of players, 
     winning_score, etc.
+    
+    players - the Players of a multi-player game, in turn order (see play.play_match)
+    final_round - whether everyone else gets one last turn once a player reaches the winning_score
     """
-    def __init__(s, winning_score = 10000):
+    def __init__(s, winning_score = 10000, players = None, final_round = True):
         s.winning_score = winning_score
+        s.players = list(players) if players is not None else []
+        s.final_round = final_round
 
 # should each player carry their stats object, or should that be passed between games...? 
 class Player():
     """
     Defines our player object, who will use information to make decisions
     """
-    def __init__(s, name, roll_strategy, score_strategy, roll_kwargs = {}, score_kwargs = {}):
+    def __init__(s, name, roll_strategy, score_strategy, roll_kwargs = {}, score_kwargs = {}, 
+                 dice = None, decision_cache = None, policy = None, instrument = None):
         s.score_strategy = score_strategy
         s.roll_strategy = roll_strategy
         s.name = name
         s.roll_kwargs = roll_kwargs
         s.score_kwargs = score_kwargs
+        # the dice source (see dice.py) this player rolls with, None for the default dice
+        s.dice = dice
+        # a cache.DecisionCache to remember the score strategy's choices in, None to not cache them
+        s.decision_cache = decision_cache
+        # a compiled policy.Policy to use instead of the strategies, None to use the strategies
+        s.policy = policy
+        # an instrument.Instrument to time this player's turns with, None to not time them
+        s.instrument = instrument
         s.turn_score = 0
         s.turn_remaining_dice = NUMBER_OF_DICE
         s.total_score = 0
@@ -71,35 +82,65 @@ class Player():
         s.number_of_turns += 1
         return s
         
-    def score_choice(s, game, scores):
+    def score_choice(s, game, options, roll=None):
         """
         Make a choice as to which of the scores the player wants to take.
         
-        Accepts a game object, and a scores dataframe
+        Accepts a game object, a tuple of ScoreOptions (see score.options) and the roll they are the
+        options of (which is only needed with a compiled policy)
         
-        Uses the score_strategy function to make the choice
+        Uses the player's compiled policy if it has one. Otherwise uses the score_strategy function to
+        make the choice, or the decision_cache if the strategy has declared the state it depends on 
+        (see strategy.depends_on)
         """
-        # add a column for ratings that will be applied to each score
-        scores['Rating'] = 0
+        depends_on = getattr(s.score_strategy, 'depends_on', None)
+        if s.policy is not None:
+            import policy
+            if roll is None:
+                raise ValueError('choosing with a compiled policy needs the roll')
+            index = policy.choose(s.policy, s.turn_score, roll)
+        elif s.decision_cache is not None and depends_on is not None:
+            # caches can be shared between players, so the state includes the strategy and kwargs deciding
+            state = decision_key(s.score_strategy, s.score_kwargs,
+                                 tuple(getattr(s, name) for name in depends_on))
+            index = s.decision_cache.get(options, state)
+            if index is None:
+                index = s.choose(game, options)
+                s.decision_cache.put(options, state, index)
+        else:
+            index = s.choose(game, options)
         
-        # send the scores to be rated, take the one with the highest rating, if tie, take the first
-        selected_score = s.score_strategy(s, scores, game).nlargest(1, 'Rating')
+        selected_score = options[index]
         
         # add the selected score to this turns's score
-        s.turn_score += int(selected_score.Score)
+        s.turn_score += selected_score.score
         
         # calculate the number of dice remaining for the next roll
-        s.turn_remaining_dice = len(selected_score.Remaining)
+        s.turn_remaining_dice = len(selected_score.remaining)
         
         return selected_score
     
+    def choose(s, game, options):
+        """
+        Ask the score_strategy to choose between the options. Returns the index of the chosen option
+        """
+        # send the options to be rated, one rating per option
+        ratings = s.score_strategy(s, options, game, **s.score_kwargs)
+        
+        # take the option with the highest rating, if tie, take the first
+        return max(range(len(options)), key=ratings.__getitem__)
+    
     def roll_again(s, game, **kwargs):
         """
         Make a choice as to whether or not to roll again. 
         
         Return True to roll again
         """
-        roll_again = s.roll_strategy(s, game, **kwargs, **s.roll_kwargs)
+        if s.policy is not None:
+            import policy
+            roll_again = policy.roll_again(s.policy, s.turn_score, s.turn_remaining_dice)
+        else:
+            roll_again = s.roll_strategy(s, game, **kwargs, **s.roll_kwargs)
 
         if roll_again: s.number_of_rolls += 1
 
@@ -125,23 +166,69 @@ class Player():
         
         return s
 
-def main(sample=10000):
+# the target scores that main compares
+# TARGETS = [100, 200, 300, 400, 500, 600]
+# TARGETS = [450, 500, 550, 600, 650, 700]
+# TARGETS = [450, 475, 500, 525, 550]
+# TARGETS = [450, 475, 487, 500, 513, 525, 550]
+# TARGETS = [450, 500, 550]
+TARGETS = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]
+
+def play_records(game, players, sample, dice=None, start=0, stop=None):
+    """
+    Play sample games with each of the players, one player after the other, and yield the result row
+    (see COLUMNS) of each game as soon as it's played.
+
+    Arguments:
+    game - the Game to play
+    players - the Players to play with
+    sample - the number of games to play with each player
+    dice - the dice source to roll (default: dice.default_dice())
+    start, stop - only play the games numbered start up to stop (in the order above), so that a long
+                  run can be split into chunks
+    """
+    stop = sample * len(players) if stop is None else stop
+    for n in range(start, stop):
+        player = players[n // sample]
+        if n % sample == 0 or n == start: print(f'\n{player.name}', end='')
+        if n % 10 == 0: print('.', end='')
+        # pretend as though this is a new player (reset all of this player's score)
+        player.reset()
+        # play a single game
+        player = play.play(game, player, dice=dice)
+        yield [player.name, player.roll_kwargs['target_score'], 
+               player.roll_strategy.__name__, 
+               player.score_strategy.__name__, 
+               player.number_of_turns, 
+               player.number_of_busts, 
+               player.number_of_rolls]
+
+def main(sample=10000, flush_every=None, on_flush=None, output=None, rows_per_chunk=1_000_000,
+         row_group_size=100_000, seed=None, aggregate=False, exact=False):
     """
     Run a loop that plays hotdice with different Players that have various combinations of 
     strategies
-    """
-    columns = ['Name', 'Target', 'RollStrat', 'ScoreStrat', 'Turns', 'Busts', 'Rolls']
-    results = pd.DataFrame(columns=columns)
     
+    For long runs, pass flush_every and on_flush to have the results handed to on_flush (as a 
+    DataFrame) every flush_every games. Only the results that haven't been flushed are returned.
+
+    For very long runs, give an output directory instead and the results are streamed to part files 
+    there (see results.ChunkWriter), rows_per_chunk games per file, and the directory is returned.
+    Read them back with results.read_chunks. Running again with the same output directory skips the
+    chunks that were already written, and with a seed every chunk plays the same games each time.
+
+    With a seed, every run plays the same games (whichever way the results are kept).
+
+    Or, with aggregate=True, only summaries of the results are kept and a DataFrame with a row per
+    player is returned instead (see stats.Aggregator.to_frame).
+
+    Or, with exact=True, no games are played at all: the distribution of every player's turns to win
+    is worked out exactly, and a DataFrame with a row per player is returned (see exact.main).
+    """
     game = Game()
     num_samples_per_player = sample
     
-    # samples = [100, 200, 300, 400, 500, 600]
-    # samples = [450, 500, 550, 600, 650, 700]
-    # samples = [450, 475, 500, 525, 550]
-    # samples = [450, 475, 487, 500, 513, 525, 550]
-    # samples = [450, 500, 550]
-    samples = [100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]
+    samples = TARGETS
 
     players = [Player(f'{target_score}hardstop-bestper', strategy.roll_stop_at_unless_hotdice, 
                                 strategy.score_best_per_dice_exclude_hot_dice, 
@@ -157,26 +244,39 @@ def main(sample=10000):
     # 5. Does real human play differ from the strategies I've enumerated? 
     # 6. Is it possible to log the data that comes out of these strategies for future comparison?
     # 7. 
-    
-    for player in players:
-        print(f'\n{player.name}', end='')
-        for n in range(num_samples_per_player):
-            if n % 10 == 0: print('.', end='')
-            # pretend as though this is a new player (reset all of this player's score)
-            player.reset()
-            # play a single game
-            player = play.play(game, player)
-            # get the results and add it to the massive results dataframe
-            results = pd.concat([results, pd.DataFrame([[player.name, player.roll_kwargs['target_score'], 
-                                                    player.roll_strategy.__name__, 
-                                                    player.score_strategy.__name__, 
-                                                    player.number_of_turns, 
-                                                    player.number_of_busts, 
-                                                    player.number_of_rolls]], columns=columns)
-                                ])
-            
-    results = results.astype({'Target':int, 'Turns':int, 'Busts':int, 'Rolls':int})
-    return results
+
+    if exact:
+        import exact as exact_turns
+        return exact_turns.main(samples, game.winning_score)
+
+    # these need pandas, which is slow to import and not needed just to play games
+    import stats
+    import results
+    import dice as dice_sources
+
+    # the chunks of an output directory are seeded one by one, so they can be played separately
+    dice = None if seed is None else dice_sources.NumpyDice(seed=seed)
+
+    if aggregate:
+        return stats.aggregate(play_records(game, players, num_samples_per_player, dice)).to_frame()
+
+    if output is None:
+        buffer = results.ResultsBuffer(COLUMNS, flush_every=flush_every, on_flush=on_flush)
+        for record in play_records(game, players, num_samples_per_player, dice):
+            buffer.append(record)
+        return buffer.to_frame()
+
+    writer = results.ChunkWriter(output, COLUMNS, rows_per_chunk=rows_per_chunk, 
+                                 row_group_size=row_group_size)
+    done = set(writer.done())
+    total = num_samples_per_player * len(players)
+    for index, start in enumerate(range(0, total, rows_per_chunk)):
+        if index in done:
+            continue
+        dice = None if seed is None else dice_sources.NumpyDice(seed=(seed, index))
+        writer.write_chunk(index, play_records(game, players, num_samples_per_player, dice, start, 
+                                               min(start + rows_per_chunk, total)))
+    return output
         
     
 if __name__ == '__main__':
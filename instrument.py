@@ -0,0 +1,165 @@
+"""
+Find out where the time of a game goes.
+
+Give play.play (or a Player) an Instrument and play.play_turn times each phase of a turn with it:
+    roll - rolling the dice
+    score - looking up the options of the roll (score.options)
+    score_choice - choosing an option (the score strategy, the decision cache or the player's policy)
+    roll_again - deciding whether to roll again (the roll strategy or the player's policy)
+    bookkeeping - busting or saving the turn score
+and counts the calls to score.options and the strategies, and the decision cache's hits and misses.
+
+Timing every phase adds a few microseconds to every roll, so with sample_every=n only every nth turn
+is instrumented and the rest are played as usual. Without an Instrument (or on the turns that aren't
+sampled), play.play_turn plays the turn without timing anything.
+
+The results can be printed as a table (report) or saved as a Chrome trace (save_trace) to open in
+chrome://tracing, Perfetto or speedscope.
+
+    instrument = Instrument(trace=True)
+    play.play(game, player, instrument=instrument)
+    print(instrument.report())
+    instrument.save_trace('game.json')
+"""
+
+import json
+import time
+from functools import partial
+from collections import defaultdict
+
+PHASES = ['roll', 'score', 'score_choice', 'roll_again', 'bookkeeping']
+
+class Instrument():
+    """
+    Cumulative timers per phase of a turn, and counters
+    """
+    def __init__(s, sample_every=1, trace=False, max_events=1_000_000):
+        """
+        Arguments:
+        sample_every - only instrument every sample_every'th turn
+        trace - keep every timed phase as an event for save_trace
+        max_events - the most events to keep, so that tracing a long run doesn't use all the memory
+        """
+        s.sample_every = sample_every
+        s.trace = trace
+        s.max_events = max_events
+        s.clear()
+
+    def clear(s):
+        """
+        Forget everything measured so far
+        """
+        # seconds and calls per phase, plus the time of the instrumented turns as a whole
+        s.times = defaultdict(float)
+        s.calls = defaultdict(int)
+        s.counters = defaultdict(int)
+        # (phase, start, duration) of the timed phases, when tracing
+        s.events = []
+        s.turns = 0
+        s.sampled_turns = 0
+        s.start = time.perf_counter()
+
+    def phase(s, name, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs), adding the time it took to the phase's timer
+        """
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        duration = time.perf_counter() - start
+        s.times[name] += duration
+        s.calls[name] += 1
+        if s.trace and len(s.events) < s.max_events:
+            s.events.append((name, start, duration))
+        return result
+
+    def timed(s, roll, options, score_choice, roll_again, bust, save_turn_score):
+        """
+        The functions play.play_turn plays each phase of a turn with, wrapped to time them
+        """
+        phases = zip(['roll', 'score', 'score_choice', 'roll_again', 'bookkeeping', 'bookkeeping'],
+                     [roll, options, score_choice, roll_again, bust, save_turn_score])
+        return [partial(s.phase, name, fn) for name, fn in phases]
+
+    def start_turn(s, player):
+        """
+        Called by play.play_turn at the start of every turn. Returns whether to time this one
+        """
+        s.turns += 1
+        if s.turns % s.sample_every:
+            return False
+        s.sampled_turns += 1
+        cache = player.decision_cache
+        s.turn_start = (time.perf_counter(),
+                        (s.calls['score'], s.calls['score_choice'], s.calls['roll_again']),
+                        (cache.hits, cache.misses) if cache is not None else (0, 0))
+        return True
+
+    def end_turn(s, player):
+        """
+        Called by play.play_turn at the end of a timed turn. Times the turn, and counts the calls to
+        score.options and whether the strategies, the decision cache or the player's policy decided
+        """
+        start, (options, choices, roll_agains), (hits, misses) = s.turn_start
+        duration = time.perf_counter() - start
+        s.times['turn'] += duration
+        if s.trace and len(s.events) < s.max_events:
+            s.events.append(('turn', start, duration))
+
+        s.counters['score.options calls'] += s.calls['score'] - options
+        choices = s.calls['score_choice'] - choices
+        cache = player.decision_cache
+        if player.policy is not None:
+            s.counters['policy lookups'] += choices
+        elif cache is not None and (cache.hits, cache.misses) != (hits, misses):
+            s.counters['cache hits'] += cache.hits - hits
+            s.counters['cache misses'] += cache.misses - misses
+            s.counters['score strategy calls'] += cache.misses - misses
+        else:
+            s.counters['score strategy calls'] += choices
+        if player.policy is None:
+            s.counters['roll strategy calls'] += s.calls['roll_again'] - roll_agains
+
+    def summary(s):
+        """
+        A list of (phase, calls, total seconds, microseconds per call, share of the instrumented turn
+        time). 'other' is the time of the turns not spent in any phase: the turn loop itself and the
+        instrumentation
+        """
+        turn_time = s.times['turn']
+        rows = []
+        for name in PHASES:
+            calls, seconds = s.calls[name], s.times[name]
+            rows.append((name, calls, seconds, 1e6 * seconds / calls if calls else 0.0,
+                         seconds / turn_time if turn_time else 0.0))
+        other = turn_time - sum(s.times[name] for name in PHASES)
+        rows.append(('other', s.sampled_turns, other,
+                     1e6 * other / s.sampled_turns if s.sampled_turns else 0.0,
+                     other / turn_time if turn_time else 0.0))
+        return rows
+
+    def report(s):
+        """
+        The summary and counters as a printable table
+        """
+        lines = [f'{s.sampled_turns} of {s.turns} turns instrumented, {s.times["turn"]:.3f}s',
+                 f'{"phase":<14}{"calls":>10}{"seconds":>12}{"us/call":>10}{"share":>8}']
+        for name, calls, seconds, per_call, share in s.summary():
+            lines.append(f'{name:<14}{calls:>10}{seconds:>12.4f}{per_call:>10.2f}{share:>8.1%}')
+        for name, count in s.counters.items():
+            lines.append(f'{name:<24}{count:>10}')
+        return '\n'.join(lines)
+
+    def trace_events(s):
+        """
+        The traced phases as Chrome trace events (complete events, times in microseconds)
+        """
+        return [{'name':name, 'ph':'X', 'ts':1e6 * (start - s.start), 'dur':1e6 * duration,
+                 'pid':0, 'tid':0} for name, start, duration in s.events]
+
+    def save_trace(s, path):
+        """
+        Save the traced phases as a Chrome trace (needs trace=True)
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents':s.trace_events(), 'displayTimeUnit':'ns',
+                       'otherData':dict(s.counters)}, f)
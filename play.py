@@ -2,14 +2,14 @@
 """
 import time
 import score
-import click
-import numpy as np
 import itertools as it
+import dice as dice_sources
 
-from hotdice import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES
 
 def roll_dice(n=NUMBER_OF_DICE, face=NUMBER_OF_FACES):
     "Roll n dice"
+    import numpy as np
     return tuple(np.random.randint(1, face+1, n))
 
 def human_roll(n=NUMBER_OF_DICE, face=NUMBER_OF_FACES):
@@ -17,30 +17,46 @@ def human_roll(n=NUMBER_OF_DICE, face=NUMBER_OF_FACES):
     time.sleep(1)
     return roll_dice(n=n, face=face)
 
-def play(game, player):
+def get_dice(player, dice=None):
     """
-    A main loop that plays a single turn of hotdice with a single player
+    The dice to roll: the dice given (see dice.py), or else the player's dice, or else the default dice
     """
+    if dice is not None:
+        return dice
+    return player.dice if player.dice is not None else dice_sources.default_dice()
+
+def play_turn(game, player, dice=None, instrument=None):
+    """
+    Play a single turn of hotdice with a single player, until they bust or save their turn score
+    
+    With an instrument.Instrument, every phase of the turn is timed (if the instrument samples it)
+    """
+    dice = get_dice(player, dice)
+    roll_dice, options_of, score_choice = dice.roll, score.options, player.score_choice
+    roll_again, bust, save_turn_score = player.roll_again, player.bust, player.save_turn_score
+    timed = instrument is not None and instrument.start_turn(player)
+    if timed:
+        roll_dice, options_of, score_choice, roll_again, bust, save_turn_score = instrument.timed(
+            roll_dice, options_of, score_choice, roll_again, bust, save_turn_score)
     
     # roll get the first roll
     roll = roll_dice()
     
-    while player.total_score < game.winning_score:
+    while True:
         # get the players scores for this roll
-        scores = score.scores(roll)
+        options = options_of(roll)
         
-        if len(scores) == 0:
-            player.bust()
-            roll = roll_dice()
-            continue
+        if len(options) == 0:
+            bust()
+            break
         
         # ask the player to select their score
-        score_selection = player.score_choice(game, scores)
+        score_selection = score_choice(game, options, roll)
         
         hotdice = player.turn_remaining_dice == 0
 
         # the player chooses whether to roll again
-        if player.roll_again(game, hotdice = hotdice):
+        if roll_again(game, hotdice = hotdice):
             # the player has hot dice
             if hotdice:
                 # roll _all_ the dice!
@@ -50,14 +66,67 @@ def play(game, player):
                 
         else:
             # the player has decided to stop, so they get to keep their turn score
-            player.save_turn_score()
+            save_turn_score()
+            break
+    
+    if timed:
+        instrument.end_turn(player)
+    return player
+
+def play(game, player, dice=None, instrument=None):
+    """
+    A main loop that plays a single game of hotdice with a single player
+    
+    The dice are rolled with the dice source given (see dice.py), or else the player's dice, or else 
+    the default dice
+    
+    Give an instrument.Instrument (or give the player one) to time the phases of every turn
+    """
+    dice = get_dice(player, dice)
+    instrument = player.instrument if instrument is None else instrument
+    
+    while player.total_score < game.winning_score:
+        play_turn(game, player, dice, instrument)
             
     return player
 
+def play_match(game, first=0, dice=None):
+    """
+    Play a single game of hotdice between all of game.players, taking turns in order starting with
+    game.players[first]. Every player's scores and stats are reset first.
+    
+    When a player reaches game.winning_score, and game.final_round is True, every other player gets one
+    last turn. The player with the highest total score wins, ties go to the player who went first.
+    
+    Returns the index of the winner in game.players
+    """
+    order = [(first + n) % len(game.players) for n in range(len(game.players))]
+    for player in game.players:
+        player.reset()
+    
+    closer = None
+    while closer is None:
+        for seat in order:
+            player = game.players[seat]
+            play_turn(game, player, dice, player.instrument)
+            if player.total_score >= game.winning_score:
+                closer = seat
+                break
+    
+    if game.final_round:
+        # everybody after the closer gets one more turn, in turn order
+        position = order.index(closer)
+        for seat in order[position + 1:] + order[:position]:
+            play_turn(game, game.players[seat], dice, game.players[seat].instrument)
+    
+    return max(order, key=lambda seat: game.players[seat].total_score)
+
 def human_play():
     """
     A main loop that can be run for a single human player to play a single turn
     """
+    import click
+
     total_score = 0
     turn_score = 0
     roll = human_roll()
@@ -0,0 +1,194 @@
+"""
+Compile a player's strategies into flat arrays of decisions.
+
+Strategies that declare what they depend on (see strategy.depends_on) are deterministic functions of
+the roll, the turn score and the remaining dice. So their decision in every state can be worked out
+once and saved in a Policy:
+    score_index - the index of the chosen option (in score.options) of every roll, -1 for busts
+    option_score / option_remaining - the score and remaining dice of those options
+    roll_again - whether to roll again with every turn score and number of remaining dice (0 for
+                 hot dice)
+
+Turn scores are bucketed by score.SCORE_UNIT, and every turn score past max_turn_score is treated as
+max_turn_score. Score choices only get a row per turn score if the score strategy depends on it.
+
+A player with a policy (Player(..., policy=...)) uses it instead of calling its strategies, and so
+does batch.play. Policies can be saved and loaded so expensive strategies only need compiling once,
+and loading maps the file, so worker processes can share one copy of a policy.
+"""
+
+import copy
+import score
+import numpy as np
+from collections import namedtuple
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES
+
+# rolls are encoded by their face counts as a base (NUMBER_OF_DICE + 1) number: the count of 1s is the
+# first digit, the count of 2s the second, etc.
+CODE_BASE = NUMBER_OF_DICE + 1
+FACE_WEIGHTS = CODE_BASE ** np.arange(NUMBER_OF_FACES)
+NUMBER_OF_CODES = CODE_BASE ** NUMBER_OF_FACES
+# FACE_WEIGHTS as Python ints, to code one roll at a time without NumPy's per-call overhead
+CODE_WEIGHTS = FACE_WEIGHTS.tolist()
+
+# the player state that compiled roll and score decisions can depend on
+ROLL_STATE = {'turn_score', 'turn_remaining_dice'}
+SCORE_STATE = {'turn_score'}
+
+Policy = namedtuple('Policy', ['name', 'turn_scores', 'score_index', 'option_score',
+                               'option_remaining', 'roll_again'])
+
+def roll_code(roll):
+    """
+    The code of a roll
+
+    >>> roll_code((1,))
+    1
+    >>> roll_code((2, 1, 1))
+    9
+    """
+    return sum(CODE_WEIGHTS[die - 1] for die in roll)
+
+def roll_codes(faces, remaining_dice):
+    """
+    The codes of many rolls at once.
+
+    Arguments:
+    faces - an array of (games, NUMBER_OF_DICE) faces
+    remaining_dice - how many of each game's dice were actually rolled, the rest are ignored
+    """
+    rolled = np.arange(faces.shape[1]) < remaining_dice[:, None]
+    return (FACE_WEIGHTS[faces - 1] * rolled).sum(axis=1)
+
+def roll_index():
+    """
+    Every roll in the scoring table, and an array from roll code to the roll's index in that list
+    (-1 for codes that aren't rolls)
+    """
+    rolls = list(score.score_table())
+    index = np.full(NUMBER_OF_CODES, -1, dtype=np.int64)
+    index[[roll_code(roll) for roll in rolls]] = np.arange(len(rolls))
+    return rolls, index
+
+# filled in the first time they are needed
+ROLLS, ROLL_INDEX = None, None
+
+def rolls_and_index():
+    """
+    ROLLS and ROLL_INDEX, made the first time they are asked for
+    """
+    global ROLLS, ROLL_INDEX
+    if ROLLS is None:
+        ROLLS, ROLL_INDEX = roll_index()
+    return ROLLS, ROLL_INDEX
+
+def dependencies(fn, compilable):
+    """
+    The state a strategy depends on, if it can be compiled (only depends on the compilable state)
+    """
+    state = getattr(fn, 'depends_on', None)
+    if state is None:
+        raise ValueError(f'{fn.__name__} has not declared what it depends on (see strategy.depends_on)')
+    if not set(state) <= compilable:
+        raise ValueError(f'{fn.__name__} depends on {set(state) - compilable}, which a policy '
+                         f'can not depend on')
+    return state
+
+def compile_policy(player, game, max_turn_score=None):
+    """
+    Evaluate the player's strategies in every state. Returns a Policy
+
+    Arguments:
+    player - the Player whose strategies (and kwargs) to compile. It isn't changed
+    game - the Game passed to the strategies
+    max_turn_score - the biggest turn score to compile decisions for (default: game.winning_score)
+    """
+    max_turn_score = game.winning_score if max_turn_score is None else max_turn_score
+    turn_scores = np.arange(max_turn_score // score.SCORE_UNIT + 1) * score.SCORE_UNIT
+    rolls, _ = rolls_and_index()
+    table = score.score_table()
+
+    # a stand in for the player, so that the strategies can be asked about any state
+    s = copy.copy(player)
+    s.decision_cache = None
+
+    score_rows = turn_scores if dependencies(player.score_strategy, SCORE_STATE) else [0]
+    score_index = np.full((len(score_rows), len(rolls)), -1, dtype=np.int16)
+    option_score = np.zeros((len(score_rows), len(rolls)), dtype=np.int32)
+    option_remaining = np.zeros((len(score_rows), len(rolls)), dtype=np.int8)
+    for row, turn_score in enumerate(score_rows):
+        s.turn_score = turn_score
+        for column, roll in enumerate(rolls):
+            options = table[roll]
+            if len(options) == 0:
+                continue
+            index = s.choose(game, options)
+            score_index[row, column] = index
+            option_score[row, column] = options[index].score
+            option_remaining[row, column] = len(options[index].remaining)
+
+    dependencies(player.roll_strategy, ROLL_STATE)
+    roll_again = np.zeros((len(turn_scores), NUMBER_OF_DICE + 1), dtype=bool)
+    for row, turn_score in enumerate(turn_scores):
+        for remaining_dice in range(NUMBER_OF_DICE + 1):
+            s.turn_score = turn_score
+            s.turn_remaining_dice = remaining_dice
+            roll_again[row, remaining_dice] = bool(player.roll_strategy(s, game,
+                                                                        hotdice=remaining_dice == 0,
+                                                                        **player.roll_kwargs))
+
+    return Policy(player.name, turn_scores, score_index, option_score, option_remaining, roll_again)
+
+def bucket(turn_score, rows):
+    """
+    The row for a turn score in an array with rows rows (works on arrays of turn scores too)
+    """
+    return np.minimum(turn_score // score.SCORE_UNIT, rows - 1)
+
+def choose(policy, turn_score, roll):
+    """
+    The index of the option the policy chooses from the options of roll (score.options(roll))
+    """
+    _, index = rolls_and_index()
+    column = -1
+    # only rolls of real dice have codes (a 0 would be taken for a NUMBER_OF_FACES, and too many dice
+    # would carry into the next face's count)
+    if 0 < len(roll) <= NUMBER_OF_DICE and 1 <= min(roll) and max(roll) <= NUMBER_OF_FACES:
+        column = index[roll_code(roll)]
+    if column < 0:
+        raise ValueError(f'{roll} is not a roll in the scoring table')
+    row = min(turn_score // score.SCORE_UNIT, len(policy.score_index) - 1)
+    return int(policy.score_index[row, column])
+
+def roll_again(policy, turn_score, remaining_dice):
+    """
+    Whether the policy rolls again
+    """
+    row = min(turn_score // score.SCORE_UNIT, len(policy.roll_again) - 1)
+    return bool(policy.roll_again[row, remaining_dice])
+
+def save(policy, path):
+    """
+    Save a policy to path, as flat arrays (see tables.py)
+    """
+    import tables
+    tables.write(path, {'turn_scores': policy.turn_scores, 'score_index': policy.score_index,
+                        'option_score': policy.option_score,
+                        'option_remaining': policy.option_remaining,
+                        'roll_again': policy.roll_again},
+                 {'name': policy.name, 'signature': repr(score.table_signature())})
+
+def load(path):
+    """
+    Load a policy saved with save. Its arrays are memory mapped (and read only), so every process that
+    loads the same file shares a single copy
+    """
+    import tables
+    saved = tables.open_table(path)
+    if saved is None:
+        raise ValueError(f'{path} is not a saved policy')
+    if saved.meta['signature'] != repr(score.table_signature()):
+        raise ValueError(f'{path} was compiled with a different scoring table')
+    arrays = saved.arrays
+    return Policy(saved.meta['name'], arrays['turn_scores'], arrays['score_index'],
+                  arrays['option_score'], arrays['option_remaining'], arrays['roll_again'])
@@ -0,0 +1,165 @@
+"""
+Exact probabilities of the outcomes of rolling 1 to NUMBER_OF_DICE dice.
+
+Rather than the closed form approximations in .old/hotdice_probabilisticly.py, this enumerates every
+distinct roll (a multiset of faces) and weights it by the number of orderings it can be rolled in (its
+multinomial coefficient). Out of NUMBER_OF_FACES ** n equally likely orderings, that gives the exact
+probability of every roll, and with score.options, of every way of scoring it.
+
+Probabilities are Fractions so that they are exact. The tables are cached to disk, like the scoring
+table, so analysis, strategies and solvers can use them without recomputing them.
+"""
+
+import os
+import math
+import pickle
+import score
+from fractions import Fraction
+from collections import namedtuple, Counter, defaultdict
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES
+
+# where the probability tables are cached between runs
+PROBABILITY_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      'probability_tables.pkl')
+
+# the outcomes of rolling a number of dice
+# rolls - every distinct sorted roll
+# weights - the number of orderings of each roll, out of total
+# bust - the probability of not being able to score
+# scores - score: the probability that the best score of the roll is score (0 for a bust)
+# remaining - dice: the probability of dice remaining after taking the best score (busts excluded)
+# options - (score, remaining dice): the probability that the roll can be scored that way
+DiceTable = namedtuple('DiceTable', ['dice', 'rolls', 'weights', 'total', 'bust', 'scores',
+                                     'remaining', 'options'])
+
+def roll_weight(roll):
+    """
+    The number of orderings of a roll (the multinomial coefficient of its face counts)
+
+    >>> roll_weight((1, 1, 1))
+    1
+    >>> roll_weight((1, 2, 3))
+    6
+    >>> roll_weight((1, 1, 2))
+    3
+    """
+    weight = math.factorial(len(roll))
+    for count in Counter(roll).values():
+        weight //= math.factorial(count)
+    return weight
+
+def roll_probability(roll, face=NUMBER_OF_FACES):
+    """
+    The exact probability of rolling a sorted roll, in any order
+
+    >>> roll_probability((1, 1))
+    Fraction(1, 36)
+    >>> roll_probability((1, 2))
+    Fraction(1, 18)
+    """
+    return Fraction(roll_weight(roll), face ** len(roll))
+
+def build_dice_table(n):
+    """
+    Enumerate every roll of n dice and tabulate its outcomes
+    """
+    rolls = tuple(score.all_rolls(n))
+    weights = tuple(roll_weight(roll) for roll in rolls)
+    total = NUMBER_OF_FACES ** n
+
+    bust = 0
+    scores, remaining, options = defaultdict(int), defaultdict(int), defaultdict(int)
+    for roll, weight in zip(rolls, weights):
+        roll_options = score.options(roll)
+        if len(roll_options) == 0:
+            bust += weight
+            scores[0] += weight
+            continue
+        # options are ordered best score first
+        scores[roll_options[0].score] += weight
+        remaining[len(roll_options[0].remaining)] += weight
+        for outcome in set((option.score, len(option.remaining)) for option in roll_options):
+            options[outcome] += weight
+
+    def exact(counts):
+        return {key: Fraction(count, total) for key, count in sorted(counts.items())}
+
+    return DiceTable(n, rolls, weights, total, Fraction(bust, total), exact(scores),
+                     exact(remaining), exact(options))
+
+def load_tables(path=PROBABILITY_TABLE_PATH, rebuild=False):
+    """
+    Load the DiceTables for 1 to NUMBER_OF_DICE dice from path, building (and saving) them if they
+    don't exist yet, if they are out of date, or if rebuild is True
+    """
+    if not rebuild and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                signature, tables = pickle.load(f)
+        except (pickle.UnpicklingError, AttributeError, EOFError):
+            # a broken file, or one saved by an older version of this module, so build them again
+            signature = None
+        if signature == score.table_signature():
+            return tables
+
+    tables = {n: build_dice_table(n) for n in range(1, NUMBER_OF_DICE + 1)}
+    try:
+        with open(path, 'wb') as f:
+            pickle.dump((score.table_signature(), tables), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        # we can't cache them, but they are still good for this process
+        pass
+    return tables
+
+# loaded the first time they are asked for
+TABLES = None
+
+def dice_table(n):
+    """
+    The DiceTable of rolling n dice
+    """
+    global TABLES
+    if TABLES is None:
+        TABLES = load_tables()
+    return TABLES[n]
+
+def bust_probability(n):
+    """
+    The exact probability of busting when rolling n dice
+
+    >>> bust_probability(1)
+    Fraction(2, 3)
+    >>> bust_probability(6)
+    Fraction(5, 162)
+    """
+    return dice_table(n).bust
+
+def expected_best_score(n):
+    """
+    The expected score of rolling n dice and taking the best score (busts score 0)
+    """
+    return sum(points * probability for points, probability in dice_table(n).scores.items())
+
+def test():
+    """
+    A mini testing suite: every table must add up, and agree with rolling every ordering of the dice
+    """
+    import itertools as it
+    for n in range(1, NUMBER_OF_DICE + 1):
+        table = dice_table(n)
+        assert sum(table.weights) == table.total, f'weights of {n} dice add up to {sum(table.weights)}'
+        assert sum(table.scores.values()) == 1, f'scores of {n} dice add up to {sum(table.scores.values())}'
+        assert sum(table.remaining.values()) == 1 - table.bust, f'remaining of {n} dice is off'
+        
+        busts = sum(len(score.options(roll)) == 0 
+                    for roll in it.product(range(1, NUMBER_OF_FACES + 1), repeat=n))
+        assert table.bust == Fraction(busts, table.total), f'{n} dice bust {table.bust} != {busts}'
+        print('.', end='')
+    print()
+    print("All tests passed")
+
+if __name__ == '__main__':
+    # run the test from the imported module, so the tables it saves unpickle anywhere (and not only
+    # when this is __main__)
+    import probability
+    probability.test()
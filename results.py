@@ -0,0 +1,243 @@
+"""
+Collect the results of many games without building a DataFrame per game.
+
+Every column is kept in a typed NumPy array that doubles in size when it fills up, so adding a row is
+cheap and the DataFrame is only built once, at the end. Text columns (like the player's name) take
+few distinct values, so they are stored as integer codes into a list of the values seen so far.
+
+For very long runs, the buffer can be flushed every so often (e.g. to disk) so that memory stays flat.
+ChunkWriter does that: it streams rows into numbered part files on disk (Parquet when pyarrow is
+installed, CSV otherwise), a row group at a time. A part file only appears once it is complete, so a
+run that crashed can pick up from the first missing chunk. read_chunks reads them back lazily.
+"""
+
+import os
+import glob
+import itertools
+from core import COLUMNS
+
+# the type of each of hotdice.COLUMNS
+COLUMN_TYPES = {'Name':str, 'Target':int, 'RollStrat':str, 'ScoreStrat':str,
+                'Turns':int, 'Busts':int, 'Rolls':int}
+
+def pyarrow():
+    """
+    Import pyarrow, or None if it isn't installed. Like numpy and pandas, it's slow to import, so
+    they are all only imported where they are used
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+class ResultsBuffer():
+    """
+    A growable, columnar buffer of result rows
+
+    >>> buffer = ResultsBuffer(['Name', 'Turns'], {'Name':str, 'Turns':int}, capacity=1)
+    >>> for turns in (40, 42, 39):
+    ...     buffer.append(['500hardstop-bestper', turns])
+    >>> len(buffer)
+    3
+    >>> buffer.to_frame().Turns.tolist()
+    [40, 42, 39]
+    """
+    def __init__(s, columns=COLUMNS, types=COLUMN_TYPES, capacity=1024, flush_every=None,
+                 on_flush=None):
+        """
+        Arguments:
+        columns - the names of the columns, in the order rows are given in
+        types - the type (str or int) of each column
+        capacity - the number of rows to make room for up front
+        flush_every - if given, call on_flush every time this many rows have been added
+        on_flush - a function that accepts the DataFrame of the rows being flushed
+        """
+        import numpy as np
+        s.columns = list(columns)
+        s.text_columns = [types[column] is str for column in s.columns]
+        s.categories = [{} if text else None for text in s.text_columns]
+        s.arrays = [np.empty(capacity, dtype=np.int64) for _ in s.columns]
+        s.size = 0
+        s.flush_every = flush_every
+        s.on_flush = on_flush
+        if flush_every is not None and on_flush is None:
+            raise ValueError('flush_every needs an on_flush function to give the rows to')
+
+    def __len__(s):
+        return s.size
+
+    def grow(s):
+        """
+        Double the capacity of every column
+        """
+        import numpy as np
+        for i, array in enumerate(s.arrays):
+            grown = np.empty(max(2 * len(array), 1), dtype=array.dtype)
+            grown[:s.size] = array[:s.size]
+            s.arrays[i] = grown
+
+    def append(s, row):
+        """
+        Add a row (a list with one value per column)
+        """
+        if s.size == len(s.arrays[0]):
+            s.grow()
+
+        for array, categories, value in zip(s.arrays, s.categories, row):
+            if categories is not None:
+                value = categories.setdefault(value, len(categories))
+            array[s.size] = value
+        s.size += 1
+
+        if s.flush_every is not None and s.size >= s.flush_every:
+            s.on_flush(s.flush())
+
+    def to_frame(s):
+        """
+        The buffered rows as a DataFrame
+        """
+        import numpy as np
+        import pandas as pd
+        data = {}
+        for column, array, categories in zip(s.columns, s.arrays, s.categories):
+            values = array[:s.size]
+            if categories is not None:
+                values = np.array(list(categories), dtype=object)[values]
+            data[column] = values
+        return pd.DataFrame(data, columns=s.columns)
+
+    def flush(s):
+        """
+        Return the buffered rows as a DataFrame and empty the buffer (keeping its capacity)
+        """
+        results = s.to_frame()
+        s.size = 0
+        return results
+
+class ChunkWriter():
+    """
+    Write result rows to a directory of part files, part-000000.parquet, part-000001.parquet, etc.
+    Each part file holds up to rows_per_chunk rows and is written row_group_size rows at a time, so
+    only one row group is ever held in memory.
+
+    Each part is written to a temporary file that is renamed once it is complete, so a part file on
+    disk is always whole. After a crash, done() gives the chunks that don't need writing again.
+    """
+    def __init__(s, directory, columns=COLUMNS, types=COLUMN_TYPES, rows_per_chunk=1_000_000,
+                 row_group_size=100_000, format=None):
+        """
+        Arguments:
+        directory - where to write the part files, it's made if it doesn't exist
+        columns, types - the columns of the rows and the type of each (as for ResultsBuffer)
+        rows_per_chunk - the number of rows in each part file
+        row_group_size - the number of rows to write at a time
+        format - 'parquet' or 'csv' (default: parquet if pyarrow is installed)
+        """
+        installed = pyarrow() is not None
+        s.format = format or ('parquet' if installed else 'csv')
+        if s.format == 'parquet' and not installed:
+            raise ValueError('writing parquet needs pyarrow, use format="csv"')
+        if s.format not in ('parquet', 'csv'):
+            raise ValueError(f'unknown format {s.format}')
+        s.directory = directory
+        s.columns = list(columns)
+        s.types = types
+        s.rows_per_chunk = rows_per_chunk
+        s.row_group_size = min(row_group_size, rows_per_chunk)
+        os.makedirs(directory, exist_ok=True)
+
+    def chunk_path(s, index):
+        return os.path.join(s.directory, f'part-{index:06d}.{s.format}')
+
+    def done(s):
+        """
+        The indexes of the chunks that have already been written
+        """
+        return sorted(int(os.path.basename(path)[5:11])
+                      for path in glob.glob(os.path.join(s.directory, f'part-*.{s.format}')))
+
+    def write_chunk(s, index, rows):
+        """
+        Write the rows (an iterable of lists with one value per column, at most rows_per_chunk of
+        them) as chunk number index. Returns the number of rows written
+        """
+        path = s.chunk_path(index)
+        temporary = path + '.tmp'
+        writer = None
+
+        def write_group(frame):
+            nonlocal writer
+            if s.format == 'parquet':
+                pa = pyarrow()
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pa.parquet.ParquetWriter(temporary, table.schema)
+                writer.write_table(table)
+            else:
+                frame.to_csv(temporary, mode='a' if writer else 'w', header=not writer, index=False)
+                writer = True
+
+        buffer = ResultsBuffer(s.columns, s.types, capacity=s.row_group_size,
+                               flush_every=s.row_group_size, on_flush=write_group)
+        written = 0
+        for row in rows:
+            buffer.append(row)
+            written += 1
+        if len(buffer) or writer is None:
+            write_group(buffer.flush())
+        if s.format == 'parquet':
+            writer.close()
+
+        os.replace(temporary, path)
+        return written
+
+    def write(s, rows):
+        """
+        Write an iterable of rows, rows_per_chunk rows per part file. The rows of chunks that were
+        already written (by a run that crashed) are skipped rather than written again, so rerunning
+        with the same rows resumes the run. Returns the indexes of the chunks written.
+
+        The skipped rows still have to be made. When making them is expensive, work out the rows
+        of each chunk separately and use write_chunk for the chunks that aren't done()
+        """
+        rows = iter(rows)
+        done = set(s.done())
+        written = []
+        for index in itertools.count():
+            first = next(rows, None)
+            if first is None:
+                return written
+            chunk = itertools.chain([first], itertools.islice(rows, s.rows_per_chunk - 1))
+            if index in done:
+                for _ in chunk:
+                    pass
+                continue
+            s.write_chunk(index, chunk)
+            written.append(index)
+
+def read_chunks(directory, columns=None, batch_size=100_000):
+    """
+    Read the results written by a ChunkWriter, lazily. Yields a DataFrame of up to batch_size rows at
+    a time, in chunk order (use pd.concat to get them all at once).
+
+    Arguments:
+    directory - the directory of part files
+    columns - the columns to read (default: all of them)
+    batch_size - the most rows to read at a time
+    """
+    import pandas as pd
+    paths = sorted(glob.glob(os.path.join(directory, 'part-*.parquet')) + 
+                   glob.glob(os.path.join(directory, 'part-*.csv')))
+    for path in paths:
+        if path.endswith('.parquet'):
+            pa = pyarrow()
+            if pa is None:
+                raise ValueError(f'reading {path} needs pyarrow')
+            batches = pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size,
+                                                                columns=columns)
+            for batch in batches:
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(path, usecols=columns, chunksize=batch_size)
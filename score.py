@@ -1,6 +1,7 @@
 """
 This file will calculate the possible earned scores of a particular roll. 
-This returns a pandas dataframe with all possible scoring combinations. Combinations, in this case, 
+This returns a tuple of ScoreOptions (or, for humans and analysis, a pandas dataframe) with all 
+possible scoring combinations. Combinations, in this case, 
 refers to all ways of scoring that use different dice (a powerset). 
 
 E.g. 
@@ -15,13 +16,12 @@ Redundant with above list and excluded:
 5, 1, 1, 5
 """
 
+import os
 import math
+import itertools as it
 import utils as ut
-import pandas as pd
-from hotdice import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES 
-
-# silence the SettingWithCopyWarning
-pd.options.mode.chained_assignment = None  # default='warn'
+from collections import namedtuple
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES
 
 # CONSTANTS:
 # ---------
@@ -30,10 +30,33 @@ FIVES_SCORE = 50
 STRAIGHT_SCORE = 1500
 MULTIPLES_SCORE = {1:1000, 2:200, 3:300, 4:400, 5:500, 6:600}
 DIE_SCORES = {1:100, 5:50}
+# every score is a multiple of this
+SCORE_UNIT = 50
 
 # the index to be used on all score DataFrames
 SCORE_COLUMNS = ['Score', 'Remaining', 'Type', 'Roll']
 
+# a single way of scoring a roll. roll and remaining are sorted tuples of dice, type is either a 
+# string or a tuple of strings (for combinations of score types)
+ScoreOption = namedtuple('ScoreOption', ['roll', 'score', 'remaining', 'type'])
+
+# bump this when the format of the scoring table changes so that old caches get rebuilt
+TABLE_VERSION = 4
+
+# where the precomputed scoring table is cached between runs, as flat arrays (see tables.py) so that
+# every process maps the same copy
+SCORE_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'score_table.bin')
+
+def pandas():
+    """
+    Import pandas, which only the DataFrame functions need. It's slow to import, so the simulations 
+    (which only use options()) don't pay for it
+    """
+    import pandas as pd
+    # silence the SettingWithCopyWarning
+    pd.options.mode.chained_assignment = None  # default='warn'
+    return pd
+
 def score_straights(roll):
     """
     Look for and score a straight.
@@ -47,6 +70,7 @@ def score_straights(roll):
     >>> score_straight([0,1,2,3,4,5])
     
     """
+    pd = pandas()
     # what to return in the case of no straight or a straight
     no_straight = pd.DataFrame(data=[[0, roll, 'straight', tuple()]], columns=SCORE_COLUMNS)
     straight = pd.DataFrame(data=[[STRAIGHT_SCORE, tuple(), 'straight', tuple(roll)]], 
@@ -92,6 +116,7 @@ def score_multiples(roll):
     >>> score_multiples([1,1,1,2,2,2])
     
     """
+    pd = pandas()
     no_multiple = pd.DataFrame(data=[[0, roll, 'multiple', tuple()]], columns=SCORE_COLUMNS)
     multiples = pd.DataFrame(data=[[0, roll, 'multiple', tuple()]], columns=SCORE_COLUMNS)
     
@@ -139,20 +164,20 @@ def score_dice(roll):
     """
     Look for individual scoring die and all of the combinations possible
     """
+    pd = pandas()
     scores = pd.DataFrame(data=[[0, roll, 'individual', tuple()]], columns=SCORE_COLUMNS)
     dice_that_score = list(DIE_SCORES.keys())
     
-    # find the dice in the roll that score points
-    scoring_dice = [die for die in roll if die in dice_that_score]
-    
-    combinations = list(ut.powerset(scoring_dice))
+    # count the dice in the roll that score points
+    scoring_dice = {die: roll.count(die) for die in dice_that_score if die in roll}
     
     # only include the rolls that couldn't score multiples
-    combinations_no_multiples = set(tuple(sorted(combo)) for combo in combinations if max([combo.count(n) for n in set(combo)]) < MIN_REPEAT_MULTIPLES)
+    combinations_no_multiples = ut.sub_multisets(scoring_dice, max_count=MIN_REPEAT_MULTIPLES - 1)
     
+    packed_roll = ut.pack(roll)
     scores_list = []
     for combo in combinations_no_multiples:
-        remaining = ut.difference(roll, combo)
+        remaining = ut.unpack(ut.packed_difference(packed_roll, ut.pack(combo)))
         score = sum((DIE_SCORES[die] for die in combo))
         scores_list.append([score, remaining, 
                             'individual', combo])
@@ -174,7 +199,8 @@ def get_score_and_type(row, scores):
     score = matches.Score.sum()
     
     score_type_set = set(matches.Type)
-    score_type = tuple(score_type_set) if len(score_type_set) > 1 else score_type_set.pop()
+    # sort the types so that the result doesn't depend on string hashing (which changes per process)
+    score_type = tuple(sorted(score_type_set)) if len(score_type_set) > 1 else score_type_set.pop()
     
     return score, score_type
 
@@ -188,18 +214,18 @@ def score_combinations(scores, roll):
     scores - a score dataframe (should have all the columns found in SCORE_COLUMNS)
     roll - the roll associated with these scores
     """
+    pd = pandas()
     no_new_combinations = pd.DataFrame(columns=SCORE_COLUMNS)
     all_scores = pd.DataFrame()
     
     scoring_rolls = scores[scores.Score > 0].Roll
     
-    # all possible sets of rolls that could contain
-    all_scores['ScoringRoll'] = pd.Series(data=ut.powerset(scoring_rolls))
+    # all possible sets of rolls that fit in the roll together
+    packed_roll = ut.pack(roll)
+    all_scores['ScoringRoll'] = pd.Series(data=list(ut.disjoint_combinations(scoring_rolls, roll)),
+                                          dtype=object)
     all_scores['CandidateRoll'] = all_scores.ScoringRoll.map(lambda x: tuple(sorted(list(ut.merge_tuple(x))[0])))
-    
-    all_scores = all_scores.loc[all_scores.CandidateRoll.map(lambda x: len(x) <= NUMBER_OF_DICE)]
-    possible_rolls = all_scores.loc[all_scores.CandidateRoll.map(lambda x: ut.intersection(x, roll) == x)]
-    new_rolls = possible_rolls.loc[~possible_rolls.CandidateRoll.isin(scoring_rolls)]
+    new_rolls = all_scores.loc[~all_scores.CandidateRoll.isin(scoring_rolls)]
     
     if len(new_rolls) == 0:
         return no_new_combinations
@@ -208,21 +234,80 @@ def score_combinations(scores, roll):
     new_rolls_best_score = new_rolls.loc[~(new_rolls.sort_values('Score', ascending=False).duplicated(['CandidateRoll'], keep='first')) | ~(new_rolls.duplicated(['CandidateRoll'], keep=False))]
     # print(new_rolls_best_score)
     new_rolls_best_score = new_rolls_best_score.drop(columns='ScoringRoll').rename(columns={'CandidateRoll':'Roll'})
-    new_rolls_best_score['Remaining'] = new_rolls_best_score.Roll.map(lambda x: ut.difference(roll, x))
+    new_rolls_best_score['Remaining'] = new_rolls_best_score.Roll.map(
+        lambda x: ut.unpack(ut.packed_difference(packed_roll, ut.pack(x))))
     
     # FIXME: type should probably be changed to be a combination of all types used ('individual', 'multiple')
     # new_rolls_best_score['Type'] = 'combination'
     return new_rolls_best_score
     
 
-def scores(roll):
+def face_choices(face, count):
+    """
+    Every way of scoring count dice showing face on their own, as (dice used, score, type)
+    
+    >>> face_choices(1, 4)
+    [(0, 0, None), (1, 100, 'individual'), (2, 200, 'individual'), (3, 1000, 'multiple'), (4, 2000, 'multiple')]
+    >>> face_choices(3, 2)
+    [(0, 0, None)]
+    """
+    choices = [(0, 0, None)]
+    for used in range(1, count+1):
+        if used >= MIN_REPEAT_MULTIPLES and face in MULTIPLES_SCORE:
+            # account for the fact that 2,2,2 is 200 (score*1) but 2,2,2,2,2 is 800 (score*2**2)
+            multiplier = 2**(used - MIN_REPEAT_MULTIPLES)
+            choices.append((used, MULTIPLES_SCORE[face] * multiplier, 'multiple'))
+        elif used < MIN_REPEAT_MULTIPLES and face in DIE_SCORES:
+            choices.append((used, DIE_SCORES[face] * used, 'individual'))
+    return choices
+
+def score_counts(roll):
+    """
+    Find all of the options of a roll from the number of dice showing each face.
+    
+    This gives the same options as score_roll, without pandas or powersets. Straights use every die,
+    so they are their own option. Otherwise the dice of each face can only be scored as individual 
+    dice or as one multiple (splitting a multiple, e.g. six 2s as 2,2,2 + 2,2,2, always scores less 
+    than the whole multiple), so the best score of any set of dice is the sum of the score of each face
+    and the options are every combination of the ways of scoring each face.
+    """
+    counts = [0] * (max(max(roll, default=0), NUMBER_OF_FACES) + 1)
+    for die in roll:
+        counts[die] += 1
+    
+    options = []
+    if len(roll) == NUMBER_OF_DICE and counts[1:NUMBER_OF_DICE+1] == [1] * NUMBER_OF_DICE:
+        options.append(ScoreOption(tuple(sorted(roll)), STRAIGHT_SCORE, tuple(), 'straight'))
+    
+    faces = [face for face, count in enumerate(counts) if count]
+    for combination in it.product(*(face_choices(face, counts[face]) for face in faces)):
+        score = sum(points for _, points, _ in combination)
+        if score == 0:
+            continue
+        
+        taken, remaining, types = [], [], set()
+        for face, (used, _, score_type) in zip(faces, combination):
+            taken += [face] * used
+            remaining += [face] * (counts[face] - used)
+            if used:
+                types.add(score_type)
+        score_type = tuple(sorted(types)) if len(types) > 1 else types.pop()
+        options.append(ScoreOption(tuple(taken), score, tuple(remaining), score_type))
+    
+    return sort_options(options)
+
+def score_roll(roll):
     """
     Accept a roll (a list of dice, e.g. [1,2,3,4,4,6]) and return a pandas DataFrame with the 
     possible scores.
     
     This function uses score* functions. score* functions are expected to accept a roll and return
     a pandas Series or DataFrame that can be concatenated to the scores DataFrame
+    
+    This computes everything from scratch, which is slow. Use options() (or scores()) instead, which
+    look the roll up in the precomputed scoring table.
     """
+    pd = pandas()
     scores = pd.concat([score_straights(roll), score_multiples(roll), score_dice(roll)], 
                                 axis=0, sort=True).reset_index()
     
@@ -234,6 +319,210 @@ def scores(roll):
     
     scores = scores.drop(columns=['index', 'level_0']).fillna(0)
     return scores.loc[scores.Score > 0][['Roll', 'Score', 'Remaining', 'Type']]
+
+def all_rolls(n=NUMBER_OF_DICE, face=NUMBER_OF_FACES):
+    """
+    Every distinct roll of n dice, sorted. Order doesn't matter when scoring, so these are all the
+    rolls we ever need to score (462 of them for six dice)
+    
+    >>> list(all_rolls(2, 3))
+    [(1, 1), (1, 2), (1, 3), (2, 2), (2, 3), (3, 3)]
+    """
+    return it.combinations_with_replacement(range(1, face+1), n)
+
+def frame_options(scores):
+    """
+    Convert a scores DataFrame (as returned by score_roll) to a tuple of ScoreOptions.
+    
+    Options are ordered best score first. Options with the same score are ordered by the number of
+    dice they use (fewest first) so that taking the first of equally good options leaves the most dice
+    """
+    return sort_options(ScoreOption(tuple(sorted(roll)), int(score), tuple(sorted(remaining)), 
+                                    score_type)
+                        for roll, score, remaining, score_type 
+                        in zip(scores.Roll, scores.Score, scores.Remaining, scores.Type))
+
+def sort_options(options):
+    """
+    Order options best score first, then fewest dice first
+    """
+    return tuple(sorted(options, key=lambda option: (-option.score, len(option.roll), option.roll)))
+
+def to_frame(options):
+    """
+    Convert a tuple of ScoreOptions to a scores DataFrame, for humans and analysis
+    """
+    pd = pandas()
+    return pd.DataFrame([[option.roll, option.score, option.remaining, option.type] 
+                         for option in options], 
+                        columns=['Roll', 'Score', 'Remaining', 'Type'])
+
+def table_signature():
+    """
+    Everything that changes the result of score_roll. A cached table is only used if it was built
+    with the same signature
+    """
+    return (TABLE_VERSION, NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES, STRAIGHT_SCORE, 
+            tuple(sorted(MULTIPLES_SCORE.items())), tuple(sorted(DIE_SCORES.items())))
+
+def build_score_table():
+    """
+    Score every sorted roll of 1 to NUMBER_OF_DICE dice. Returns a dictionary of roll: options
+    """
+    return {roll: score_counts(roll) for n in range(1, NUMBER_OF_DICE+1) for roll in all_rolls(n)}
+
+def table_arrays(table):
+    """
+    The scoring table as flat arrays, with every roll packed into an int (see utils.pack):
+        rolls - the rolls, in the order of the table
+        starts - where the options of each roll start in the option arrays, and where the last ends
+        codes, rows - the packed rolls in order, and the row of each, to look rolls up
+        option_roll, option_score, option_remaining - the options of every roll, one after the other
+        option_type - the index of the option's type in types
+    Returns (arrays, types)
+    """
+    import numpy as np
+    types = sorted({option.type for options in table.values() for option in options}, key=repr)
+    type_index = {score_type: index for index, score_type in enumerate(types)}
+    options = [option for roll_options in table.values() for option in roll_options]
+    rolls = np.array([ut.pack(roll) for roll in table], dtype=np.int64)
+    arrays = {'rolls': rolls,
+              'starts': np.cumsum([0] + [len(roll_options) for roll_options in table.values()]),
+              'codes': np.sort(rolls),
+              'rows': np.argsort(rolls),
+              'option_roll': np.array([ut.pack(option.roll) for option in options], dtype=np.int64),
+              'option_score': np.array([option.score for option in options], dtype=np.int64),
+              'option_remaining': np.array([ut.pack(option.remaining) for option in options], 
+                                           dtype=np.int64),
+              'option_type': np.array([type_index[option.type] for option in options], 
+                                      dtype=np.int16)}
+    return arrays, types
+
+class ScoreTable():
+    """
+    The scoring table as a mapping of sorted roll: options, read from the arrays of table_arrays.
+
+    The arrays are memory mapped from the saved table (see load_score_table), so every process shares
+    them. A roll's options are only made into a tuple of ScoreOptions the first time the roll is 
+    looked up, and that tuple is kept, so looking a roll up again gives the same tuple (which
+    cache.DecisionCache relies on)
+    """
+    def __init__(s, arrays, types):
+        s.arrays = arrays
+        # types of combinations are tuples, which were saved as lists
+        s.types = [tuple(score_type) if isinstance(score_type, list) else score_type 
+                   for score_type in types]
+        s.looked_up = {}
+
+    def row(s, roll):
+        """
+        The row of a sorted roll, or None if it isn't in the table
+        """
+        try:
+            code = ut.pack(roll)
+        except ValueError:
+            return None
+        codes = s.arrays['codes']
+        position = int(codes.searchsorted(code))
+        if position == len(codes) or codes[position] != code:
+            return None
+        return int(s.arrays['rows'][position])
+
+    def __getitem__(s, roll):
+        options = s.looked_up.get(roll)
+        if options is None:
+            row = s.row(roll)
+            if row is None:
+                raise KeyError(roll)
+            arrays = s.arrays
+            span = slice(int(arrays['starts'][row]), int(arrays['starts'][row + 1]))
+            options = tuple(ScoreOption(ut.unpack(used), score, ut.unpack(remaining), 
+                                        s.types[score_type])
+                            for used, score, remaining, score_type 
+                            in zip(arrays['option_roll'][span].tolist(), 
+                                   arrays['option_score'][span].tolist(),
+                                   arrays['option_remaining'][span].tolist(), 
+                                   arrays['option_type'][span].tolist()))
+            s.looked_up[roll] = options
+        return options
+
+    def __contains__(s, roll):
+        return roll in s.looked_up or s.row(roll) is not None
+
+    def __iter__(s):
+        return (ut.unpack(code) for code in s.arrays['rolls'].tolist())
+
+    def __len__(s):
+        return len(s.arrays['rolls'])
+
+def load_score_table(path=SCORE_TABLE_PATH, rebuild=False):
+    """
+    Load the scoring table (a ScoreTable) from path, building (and saving) it if it doesn't exist yet,
+    if it is out of date, or if rebuild is True
+    
+    Building the table only happens once. Loading maps the saved arrays (see tables.py), so the
+    processes that load it share them
+    """
+    import tables
+    signature = repr(table_signature())
+    if not rebuild and os.path.exists(path):
+        saved = tables.open_table(path)
+        if saved is not None and saved.meta.get('signature') == signature:
+            return ScoreTable(saved.arrays, saved.meta['types'])
+    
+    arrays, types = table_arrays(build_score_table())
+    try:
+        tables.write(path, arrays, {'signature': signature, 'types': types})
+    except OSError:
+        # we can't cache it (e.g. read only install), but the table is still good for this process
+        return ScoreTable(arrays, types)
+    return ScoreTable(tables.open_table(path).arrays, types)
+
+# loaded on the first call to options() so that importing this module stays cheap
+SCORE_TABLE = None
+
+def score_table():
+    """
+    Return the scoring table, loading it if this is the first time it has been asked for
+    """
+    global SCORE_TABLE
+    if SCORE_TABLE is None:
+        SCORE_TABLE = load_score_table()
+    return SCORE_TABLE
+
+def options(roll, check=False):
+    """
+    Accept a roll (a list of dice, e.g. [1,2,3,4,4,6]) and return a tuple of ScoreOptions, one for 
+    each possible score. An empty tuple means the roll is a bust.
+    
+    The options are looked up in the scoring table by the sorted roll. Rolls that aren't in the table
+    (e.g. rolls with 0s, which the tests use to mean "no die") are scored with score_counts.
+    
+    Arguments:
+    roll - the dice rolled
+    check - if True, also score the roll with score_roll and make sure the results are identical
+    """
+    key = tuple(sorted(roll))
+    table = score_table()
+    
+    if key not in table:
+        return score_counts(key)
+    
+    if check:
+        expected = frame_options(score_roll(key))
+        assert table[key] == expected, f'table {table[key]} != {expected} for roll {key}'
+    
+    # tuples of namedtuples are immutable, so there's no need to copy
+    return table[key]
+
+def scores(roll, check=False):
+    """
+    Accept a roll (a list of dice, e.g. [1,2,3,4,4,6]) and return a pandas DataFrame with the 
+    possible scores.
+    
+    This is a DataFrame adapter around options(), which the simulations should use instead
+    """
+    return to_frame(options(roll, check=check))
     
 def manual():
     scores([1,2,3,4,5,6])
@@ -317,6 +606,25 @@ def test():
             assert result_score == goal_score, f'result {result_score} != {goal_score} for roll {roll}   {tuple(sorted(roll))}\n{res}'
             print('.', end='')
         print()
+    
+    # the options must be exactly the same as the ones from the (slow) DataFrame functions
+    import time
+    print('counts')
+    frame_time, counts_time = 0, 0
+    for roll in tests:
+        # score_roll must be given a sorted roll (otherwise it can count a straight twice)
+        roll = tuple(sorted(roll))
+        start = time.perf_counter()
+        expected = frame_options(score_roll(roll))
+        frame_time += time.perf_counter() - start
+        start = time.perf_counter()
+        result = score_counts(roll)
+        counts_time += time.perf_counter() - start
+        assert result == expected, f'result {result} != {expected} for roll {roll}'
+        print('.', end='')
+    print()
+    print(f'score_roll: {frame_time / len(tests) * 1e6:.0f}us per roll, '
+          f'score_counts: {counts_time / len(tests) * 1e6:.0f}us per roll')
     print("All tests passed")
     
 if __name__ == '__main__':
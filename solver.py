@@ -0,0 +1,358 @@
+"""
+Work out exactly how many points to score before stopping, instead of simulating.
+
+A turn is in a state of (turn_score, remaining_dice). From each state the player can stop and bank the
+turn score, or roll the remaining dice. We know the exact probability of every roll (see probability)
+and every way of scoring it (see score.options), so the expected value of every state, and whether to
+roll or stop there, can be computed by dynamic programming.
+
+Every score is a multiple of SCORE_UNIT, and every roll that doesn't bust adds at least SCORE_UNIT to
+the turn score. So the value of a state only depends on the values of states with a bigger turn score,
+and the states can be solved exactly from the biggest turn score down.
+
+The full game (solve_game) adds the banked score to the state. What matters there isn't the points of a
+turn but the number of turns left to reach the winning score, and near the end it's best to stop as
+soon as the winning score is reached. Every turn that doesn't bust banks points, so each banked score
+only depends on bigger ones, apart from busting, which starts the same banked score over. So the
+banked scores are solved from the biggest down, each one by iterating on its own expected turns until
+the policy stops changing.
+"""
+
+import os
+import score
+import probability
+from collections import namedtuple
+from score import SCORE_UNIT
+from core import NUMBER_OF_DICE
+
+# the solution of the single turn problem. Arrays are indexed by [turn score / SCORE_UNIT, dice]
+# value - the expected number of points banked this turn from that state when playing optimally
+# roll_again - True if rolling again is better than stopping
+TurnPolicy = namedtuple('TurnPolicy', ['turn_scores', 'value', 'roll_again'])
+
+# the roll/score options of rolling a number of dice, as flat arrays of (roll, option) pairs
+Transitions = namedtuple('Transitions', ['probability', 'starts', 'score', 'dice'])
+
+def transitions(n):
+    """
+    Every (roll, option) pair of rolling n dice. Busts have no options, so they are left out.
+
+    probability - the probability of each roll
+    starts - the index of the first option of each roll
+    score - the score of each option, in SCORE_UNITs
+    dice - the dice the player rolls next after taking each option (all of them for hot dice)
+    """
+    import numpy as np
+    table = probability.dice_table(n)
+    probabilities, starts, scores, dice = [], [], [], []
+    for roll, weight in zip(table.rolls, table.weights):
+        options = score.options(roll)
+        if len(options) == 0:
+            continue
+        probabilities.append(weight / table.total)
+        starts.append(len(scores))
+        for option in options:
+            scores.append(option.score // SCORE_UNIT)
+            dice.append(len(option.remaining) or NUMBER_OF_DICE)
+    return Transitions(np.array(probabilities), np.array(starts), np.array(scores), np.array(dice))
+
+def solve_turn(max_turn_score=20000):
+    """
+    Find the policy that maximizes the expected points banked in a single turn.
+
+    States with a turn score of max_turn_score or more are assumed to stop. Pick it big enough that
+    the policy already stops well below it (the last rows of roll_again should all be False).
+
+    Returns a TurnPolicy
+    """
+    import numpy as np
+    size = max_turn_score // SCORE_UNIT
+    moves = {n: transitions(n) for n in range(1, NUMBER_OF_DICE + 1)}
+    largest = max(move.score.max() for move in moves.values())
+
+    # the value of stopping in every state, which is also the value of every state past the cap
+    turn_scores = np.arange(size + largest + 1) * SCORE_UNIT
+    value = np.repeat(turn_scores[:, None].astype(float), NUMBER_OF_DICE + 1, axis=1)
+    roll_again = np.zeros((size, NUMBER_OF_DICE + 1), dtype=bool)
+
+    for t in range(size - 1, -1, -1):
+        for n, move in moves.items():
+            # for every roll take the best option, then average over the rolls (busts are worth 0)
+            best = np.maximum.reduceat(value[t + move.score, move.dice], move.starts)
+            expected = best @ move.probability
+            if expected > value[t, n]:
+                value[t, n] = expected
+                roll_again[t, n] = True
+
+    return TurnPolicy(turn_scores[:size], value[:size], roll_again)
+
+# the solution of the full game, for every banked score below the winning score (in SCORE_UNITs). The
+# states of a banked score b are the turn scores that don't reach the winning score, so there are
+# fewer of them the more is banked. They are stored one banked score after the other in flat arrays:
+# the states of b are at offsets[b]:offsets[b + 1], a row of NUMBER_OF_DICE per turn score
+# winning_score - the winning score the game was solved for
+# expected_turns - the expected turns left at the start of a turn, by banked score
+# offsets - the index of the first state of each banked score
+# value - the expected turns left (including the current turn) from each state when playing optimally
+# roll_again - whether rolling again takes fewer turns than stopping in each state
+# iterations, residuals - how many iterations each banked score took, and how far from a fixed point
+#                         its expected turns were at the end (convergence diagnostics)
+GamePolicy = namedtuple('GamePolicy', ['winning_score', 'expected_turns', 'offsets', 'value',
+                                       'roll_again', 'iterations', 'residuals'])
+
+def all_transitions():
+    """
+    The transitions of rolling any number of dice, one after the other. Returns the Transitions and an
+    array with the number of dice rolled for each roll
+    """
+    import numpy as np
+    moves = [transitions(n) for n in range(1, NUMBER_OF_DICE + 1)]
+    starts = np.cumsum([0] + [len(move.score) for move in moves[:-1]])
+    rolled = np.concatenate([np.full(len(move.probability), n) for n, move in enumerate(moves, 1)])
+    return Transitions(np.concatenate([move.probability for move in moves]),
+                       np.concatenate([move.starts + start for move, start in zip(moves, starts)]),
+                       np.concatenate([move.score for move in moves]),
+                       np.concatenate([move.dice for move in moves])), rolled
+
+def solve_banked(moves, rolled, bust, rows, stop, guess, tolerance, max_iterations):
+    """
+    Solve the turns of a single banked score.
+
+    Every state's expected turns are linear in the expected turns E of the banked score itself (that
+    is where a bust goes back to): a + p * E, where p is the probability of busting before the turn
+    ends. For a fixed guess of E, a sweep from the biggest turn score down finds the best decision in
+    every state and its a and p, and then E = a / (1 - p) is exact for those decisions. That's repeated
+    (policy iteration) until E stops changing.
+
+    Arguments:
+    moves, rolled - from all_transitions
+    bust - the probability of busting with each number of dice
+    rows - the number of turn scores that don't reach the winning score
+    stop - the expected turns of stopping with each of those turn scores (1 + the expected turns of
+           the banked score it makes)
+    guess - the first guess of E
+    tolerance, max_iterations - when to stop iterating
+
+    Returns (E, value, roll_again, iterations, residual), value and roll_again have a row per turn
+    score and a column per number of dice (from 1)
+    """
+    import numpy as np
+    largest = moves.score.max()
+    segment = np.repeat(np.arange(len(moves.starts)), np.diff(np.append(moves.starts, len(moves.score))))
+    position = np.arange(len(moves.score))
+    # turn scores that reach the winning score end the game this turn
+    a = np.ones((rows + largest + 1, NUMBER_OF_DICE + 1))
+    p = np.zeros((rows + largest + 1, NUMBER_OF_DICE + 1))
+    roll_again = np.zeros((rows, NUMBER_OF_DICE + 1), dtype=bool)
+
+    expected = guess
+    for iteration in range(1, max_iterations + 1):
+        for t in range(rows - 1, -1, -1):
+            # the best option of every roll, and its a and p
+            values = a[t + moves.score, moves.dice] + p[t + moves.score, moves.dice] * expected
+            best = np.minimum.reduceat(values, moves.starts)
+            chosen = np.minimum.reduceat(np.where(values == best[segment], position, len(position)),
+                                         moves.starts)
+            roll_a = np.bincount(rolled, moves.probability * a[t + moves.score[chosen], 
+                                                                moves.dice[chosen]], 
+                                 NUMBER_OF_DICE + 1) + bust
+            roll_p = np.bincount(rolled, moves.probability * p[t + moves.score[chosen], 
+                                                                moves.dice[chosen]], 
+                                 NUMBER_OF_DICE + 1) + bust
+            # the first roll of a turn has to be made (stopping would bank nothing)
+            rolls = (roll_a + roll_p * expected < stop[t]) | (t == 0)
+            a[t] = np.where(rolls, roll_a, stop[t])
+            p[t] = np.where(rolls, roll_p, 0)
+            roll_again[t] = rolls
+
+        updated = a[0, NUMBER_OF_DICE] / (1 - p[0, NUMBER_OF_DICE])
+        residual = abs(updated - expected)
+        expected = updated
+        if residual <= tolerance:
+            break
+
+    value = a[:rows] + p[:rows] * expected
+    return expected, value[:, 1:], roll_again[:, 1:], iteration, residual
+
+def solve_game(winning_score=10000, tolerance=1e-9, max_iterations=100, verbose=False):
+    """
+    Find the policy that reaches winning_score in the fewest turns on average, for every banked score,
+    turn score and number of dice. Returns a GamePolicy
+    """
+    import numpy as np
+    moves, rolled = all_transitions()
+    bust = 1 - np.bincount(rolled, moves.probability, NUMBER_OF_DICE + 1)
+    bust[0] = 0
+    goal = -(-winning_score // SCORE_UNIT)
+
+    # the expected turns of every banked score, 0 once the winning score is reached
+    expected_turns = np.zeros(goal + 1)
+    sizes = (goal - np.arange(goal)) * NUMBER_OF_DICE
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    value = np.empty(offsets[-1])
+    roll_again = np.empty(offsets[-1], dtype=bool)
+    iterations = np.zeros(goal, dtype=np.int64)
+    residuals = np.zeros(goal)
+
+    for b in range(goal - 1, -1, -1):
+        rows = goal - b
+        stop = 1 + expected_turns[b:goal]
+        solved = solve_banked(moves, rolled, bust, rows, stop, 1 + expected_turns[b + 1], tolerance,
+                              max_iterations)
+        expected_turns[b], state_value, state_roll_again, iterations[b], residuals[b] = solved
+        value[offsets[b]:offsets[b + 1]] = state_value.ravel()
+        roll_again[offsets[b]:offsets[b + 1]] = state_roll_again.ravel()
+        if verbose and b % 20 == 0:
+            print(f'banked {b * SCORE_UNIT}: {expected_turns[b]:.4f} turns, {iterations[b]} iterations')
+
+    return GamePolicy(winning_score, expected_turns[:goal], offsets, value, roll_again, iterations,
+                      residuals)
+
+def game_state(policy, banked, turn_score, dice):
+    """
+    The index of a state in the flat arrays of a GamePolicy, or None if the turn score reaches the
+    winning score (so the player should stop)
+    """
+    b, t = banked // SCORE_UNIT, turn_score // SCORE_UNIT
+    if banked + turn_score >= policy.winning_score:
+        return None
+    return policy.offsets[b] + t * NUMBER_OF_DICE + (dice or NUMBER_OF_DICE) - 1
+
+def game_roll_again(policy, banked, turn_score, dice):
+    """
+    Whether the policy rolls again. dice is the number of dice left, 0 for hot dice
+    """
+    state = game_state(policy, banked, turn_score, dice)
+    return state is not None and bool(policy.roll_again[state])
+
+def game_value(policy, banked, turn_score, dice):
+    """
+    The expected turns left (including this one) in a state, playing optimally
+    """
+    state = game_state(policy, banked, turn_score, dice)
+    return 1.0 if state is None else float(policy.value[state])
+
+def save_game_policy(policy, path):
+    """
+    Save a GamePolicy to path, as flat arrays (see tables.py)
+    """
+    import tables
+    tables.write(path, {name: getattr(policy, name) for name in GamePolicy._fields[1:]},
+                 {'winning_score': policy.winning_score,
+                  'signature': repr(score.table_signature())})
+
+def load_game_policy(path):
+    """
+    Load a GamePolicy saved with save_game_policy, memory mapped so that every process that loads it
+    shares a single copy. Returns None if it isn't one, or was solved with a different scoring table
+    """
+    import tables
+    saved = tables.open_table(path)
+    if saved is None or saved.meta.get('signature') != repr(score.table_signature()):
+        return None
+    return GamePolicy(saved.meta['winning_score'], *(saved.arrays[name] 
+                                                     for name in GamePolicy._fields[1:]))
+
+# where solved game policies are cached between runs, by winning score
+GAME_POLICY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_policy_{}.bin')
+
+# solved game policies by winning score, loaded (or solved) the first time they are asked for
+GAME_POLICIES = {}
+
+def game_policy(winning_score=10000, path=None):
+    """
+    The GamePolicy for winning_score. The first time it's asked for it is solved and saved to path 
+    (default: GAME_POLICY_PATH), and after that it's loaded from there, so worker processes don't 
+    each have to solve it
+    """
+    if winning_score not in GAME_POLICIES:
+        path = GAME_POLICY_PATH.format(winning_score) if path is None else path
+        policy = load_game_policy(path) if os.path.exists(path) else None
+        if policy is None or policy.winning_score != winning_score:
+            policy = solve_game(winning_score)
+            try:
+                save_game_policy(policy, path)
+            except OSError:
+                # we can't cache it, but it's still good for this process
+                pass
+        GAME_POLICIES[winning_score] = policy
+    return GAME_POLICIES[winning_score]
+
+def thresholds(policy):
+    """
+    The smallest turn score at which the policy stops, for each number of dice
+    """
+    import numpy as np
+    return {n: int(policy.turn_scores[np.argmin(policy.roll_again[:, n])])
+            for n in range(1, NUMBER_OF_DICE + 1)}
+
+def policy_frame(policy):
+    """
+    The policy as a DataFrame, with a row for every state
+    """
+    import numpy as np
+    import pandas as pd
+    turn_scores, dice = np.meshgrid(policy.turn_scores, np.arange(1, NUMBER_OF_DICE + 1),
+                                    indexing='ij')
+    return pd.DataFrame({'TurnScore': turn_scores.ravel(),
+                         'Dice': dice.ravel(),
+                         'Value': policy.value[:, 1:].ravel(),
+                         'RollAgain': policy.roll_again[:, 1:].ravel()})
+
+def best_option(policy, turn_score, options):
+    """
+    The option that is worth the most with the given turn score, according to the policy
+    """
+    def worth(option):
+        t = (turn_score + option.score) // SCORE_UNIT
+        if t >= len(policy.value):
+            # past the cap every state stops
+            return turn_score + option.score
+        return policy.value[t, len(option.remaining) or NUMBER_OF_DICE]
+    return max(options, key=worth)
+
+def test():
+    """
+    A mini testing suite: the single turn policy must stop where it always has, a game that any
+    score wins must take one turn plus the busts, and no fixed target can beat the full game policy
+    (worked out exactly for those, see exact.py)
+    """
+    import strategy
+    from exact import player_turns_to_win
+    from hotdice import Game, Player
+
+    policy = solve_turn()
+    assert thresholds(policy) == {1: 300, 2: 250, 3: 400, 4: 1050, 5: 3050, 6: 11650}, \
+        f'turn thresholds {thresholds(policy)}'
+    assert abs(policy.value[0, NUMBER_OF_DICE] - 512.9118) < 1e-3, \
+        f'expected points per turn {policy.value[0, NUMBER_OF_DICE]}'
+    print('.', end='')
+
+    # any score wins, so the only way to take more than one turn is to bust all six dice
+    game = solve_game(SCORE_UNIT)
+    bust = float(probability.dice_table(NUMBER_OF_DICE).bust)
+    assert abs(game.expected_turns[0] - 1 / (1 - bust)) < 1e-9, \
+        f'expected turns to {SCORE_UNIT} {game.expected_turns[0]} != {1 / (1 - bust)}'
+    print('.', end='')
+
+    game = solve_game(1000)
+    assert abs(game.expected_turns[0] - 2.64787) < 1e-4, f'expected turns {game.expected_turns[0]}'
+    assert game.residuals.max() < 1e-6, f'residual {game.residuals.max()}'
+    for target_score in (300, 400, 1000):
+        player = Player('test', strategy.roll_stop_at_unless_hotdice, strategy.score_best_per_dice,
+                        roll_kwargs={'target_score':target_score})
+        turns = player_turns_to_win(player, Game(winning_score=1000)).mean
+        assert game.expected_turns[0] <= turns, \
+            f'stopping at {target_score} takes {turns} turns < {game.expected_turns[0]}'
+    print('.', end='')
+    print()
+    print("All tests passed")
+
+if __name__ == '__main__':
+    policy = solve_turn()
+    print(f'Expected points per turn: {policy.value[0, NUMBER_OF_DICE]:.1f}')
+    print('Stop at:', thresholds(policy))
+
+    game = solve_game()
+    print(f'Expected turns to reach {game.winning_score}: {game.expected_turns[0]:.3f} (most '
+          f'iterations {game.iterations.max()}, largest residual {game.residuals.max():.1e})')
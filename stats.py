@@ -0,0 +1,234 @@
+"""
+Summarize results as they come in, instead of keeping a row per game.
+
+Most questions about the results of hotdice.main are means, spreads and quantiles of Turns, Busts and
+Rolls for each player configuration. An Aggregator keeps just enough to answer those for every
+configuration, so its memory grows with the number of configurations, not the number of games:
+    Moments - the count, mean and sum of squared deviations, updated with Welford's method
+    Histogram - the count of each value. Turns, busts and rolls are small whole numbers, so counting
+                them exactly takes less room than a quantile sketch (t-digest, P²) and gives exact
+                quantiles
+
+Both can be merged, so every worker process can aggregate its own games and the results combined.
+"""
+
+from statistics import NormalDist
+from core import COLUMNS
+
+# the columns that identify a player configuration, and the columns that are summarized
+KEY_COLUMNS = ['Name', 'Target', 'RollStrat', 'ScoreStrat']
+VALUE_COLUMNS = ['Turns', 'Busts', 'Rolls']
+
+class Moments():
+    """
+    The running count, mean and variance of a stream of numbers
+
+    >>> moments = Moments()
+    >>> for x in (2, 4, 4, 4, 5, 5, 7, 9):
+    ...     moments.add(x)
+    >>> moments.mean, moments.variance(ddof=0)
+    (5.0, 4.0)
+    >>> other = Moments()
+    >>> other.add(10)
+    >>> moments.merge(other).count, round(moments.mean, 3)
+    (9, 5.556)
+    """
+    def __init__(s):
+        s.count = 0
+        s.mean = 0.0
+        # the sum of the squared differences from the mean
+        s.m2 = 0.0
+
+    def add(s, x):
+        s.count += 1
+        delta = x - s.mean
+        s.mean += delta / s.count
+        s.m2 += delta * (x - s.mean)
+
+    def add_array(s, values):
+        """
+        Add an array of numbers at once
+        """
+        import numpy as np
+        values = np.asarray(values, dtype=float)
+        if len(values):
+            other = Moments()
+            other.count, other.mean = len(values), values.mean()
+            other.m2 = ((values - other.mean) ** 2).sum()
+            s.merge(other)
+
+    def merge(s, other):
+        """
+        Add the numbers summarized by another Moments (Chan et al.'s parallel update). Returns self
+        """
+        count = s.count + other.count
+        if count == 0:
+            return s
+        delta = other.mean - s.mean
+        s.m2 += other.m2 + delta ** 2 * s.count * other.count / count
+        s.mean += delta * other.count / count
+        s.count = count
+        return s
+
+    def variance(s, ddof=1):
+        return s.m2 / (s.count - ddof) if s.count > ddof else float('nan')
+
+    def std(s, ddof=1):
+        return s.variance(ddof) ** 0.5
+
+    def confidence_interval(s, confidence=0.95):
+        """
+        The (low, high) confidence interval of the mean, from the normal approximation
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * s.std() / s.count ** 0.5 if s.count else float('nan')
+        return s.mean - half_width, s.mean + half_width
+
+class Histogram():
+    """
+    The count of each value in a stream of non-negative whole numbers
+
+    >>> histogram = Histogram()
+    >>> histogram.add_array([3, 1, 2, 2, 10])
+    >>> histogram.quantile(0.5), histogram.quantile(1)
+    (2, 10)
+    """
+    def __init__(s):
+        import numpy as np
+        s.counts = np.zeros(0, dtype=np.int64)
+
+    def grow(s, size):
+        """
+        Make room for values below size
+        """
+        if size > len(s.counts):
+            import numpy as np
+            grown = np.zeros(max(size, 2 * len(s.counts)), dtype=np.int64)
+            grown[:len(s.counts)] = s.counts
+            s.counts = grown
+
+    def add(s, x):
+        s.grow(x + 1)
+        s.counts[x] += 1
+
+    def add_array(s, values):
+        import numpy as np
+        values = np.asarray(values, dtype=np.int64)
+        if len(values):
+            counts = np.bincount(values)
+            s.grow(len(counts))
+            s.counts[:len(counts)] += counts
+
+    def merge(s, other):
+        """
+        Add the counts of another Histogram. Returns self
+        """
+        s.grow(len(other.counts))
+        s.counts[:len(other.counts)] += other.counts
+        return s
+
+    def quantile(s, q):
+        """
+        The smallest value that at least a fraction q of the values are less than or equal to
+        """
+        import numpy as np
+        cumulative = np.cumsum(s.counts)
+        if len(cumulative) == 0 or cumulative[-1] == 0:
+            return None
+        return int(np.searchsorted(cumulative, max(q * cumulative[-1], 1)))
+
+class Summary():
+    """
+    The Moments and Histogram of one column
+    """
+    def __init__(s):
+        s.moments = Moments()
+        s.histogram = Histogram()
+
+    def add(s, x):
+        s.moments.add(x)
+        s.histogram.add(x)
+
+    def add_array(s, values):
+        s.moments.add_array(values)
+        s.histogram.add_array(values)
+
+    def merge(s, other):
+        s.moments.merge(other.moments)
+        s.histogram.merge(other.histogram)
+        return s
+
+class Aggregator():
+    """
+    Summaries of the VALUE_COLUMNS of result rows (see hotdice.COLUMNS) for each configuration (the
+    KEY_COLUMNS)
+    """
+    def __init__(s, columns=COLUMNS):
+        s.columns = list(columns)
+        s.key_positions = [s.columns.index(column) for column in KEY_COLUMNS]
+        s.value_positions = [s.columns.index(column) for column in VALUE_COLUMNS]
+        s.summaries = {}
+
+    def __len__(s):
+        return len(s.summaries)
+
+    def summaries_of(s, key):
+        if key not in s.summaries:
+            s.summaries[key] = [Summary() for _ in VALUE_COLUMNS]
+        return s.summaries[key]
+
+    def add(s, row):
+        """
+        Add a result row (a list with a value for each of the columns)
+        """
+        summaries = s.summaries_of(tuple(row[i] for i in s.key_positions))
+        for summary, i in zip(summaries, s.value_positions):
+            summary.add(row[i])
+
+    def add_frame(s, frame):
+        """
+        Add a DataFrame of result rows
+        """
+        for key, group in frame.groupby(KEY_COLUMNS, sort=False, dropna=False):
+            summaries = s.summaries_of(tuple(key))
+            for summary, column in zip(summaries, VALUE_COLUMNS):
+                summary.add_array(group[column].to_numpy())
+
+    def merge(s, other):
+        """
+        Add everything summarized by another Aggregator. Returns self
+        """
+        for key, summaries in other.summaries.items():
+            for summary, theirs in zip(s.summaries_of(key), summaries):
+                summary.merge(theirs)
+        return s
+
+    def to_frame(s, confidence=0.95, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        A DataFrame with a row per configuration, with the Games played and, for each of the
+        VALUE_COLUMNS, the Mean, Std, the confidence interval of the mean (Low, High) and the given
+        quantiles (e.g. Turns.Q50 for the median number of turns)
+        """
+        import pandas as pd
+        rows = []
+        for key, summaries in s.summaries.items():
+            row = dict(zip(KEY_COLUMNS, key))
+            row['Games'] = summaries[0].moments.count
+            for column, summary in zip(VALUE_COLUMNS, summaries):
+                moments = summary.moments
+                low, high = moments.confidence_interval(confidence)
+                row.update({f'{column}.Mean':moments.mean, f'{column}.Std':moments.std(),
+                            f'{column}.Low':low, f'{column}.High':high})
+                for q in quantiles:
+                    row[f'{column}.Q{round(100 * q):02d}'] = summary.histogram.quantile(q)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+def aggregate(rows, columns=COLUMNS):
+    """
+    Summarize an iterable of result rows. Returns an Aggregator
+    """
+    aggregator = Aggregator(columns)
+    for row in rows:
+        aggregator.add(row)
+    return aggregator
@@ -3,22 +3,34 @@ Players can have different strategies when it comes to playing hot dice.
 
 Essentially, they can have either roll strategies, or score selection strategies
 
-All scores must have ratings by the time they are returned
-The player object generally just selects the roll with the best rating.
+Score selection strategies accept a tuple of ScoreOptions (see score.options) and must return a 
+rating for each option, in the same order.
+The player object generally just selects the option with the best rating.
+
+Strategies declare the player state their decision depends on (besides the roll and their kwargs) with
+depends_on. Decisions of strategies that have declared it can be cached (see cache.py).
 """
 
-import pandas as pd
-from hotdice import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES
+from core import NUMBER_OF_DICE, NUMBER_OF_FACES, MIN_REPEAT_MULTIPLES
+
+def depends_on(*state):
+    """
+    Declare the Player attributes (e.g. 'turn_score') that a strategy's decision depends on. An empty
+    declaration means the decision only depends on the roll and the strategy's kwargs.
+    """
+    def declare(fn):
+        fn.depends_on = state
+        return fn
+    return declare
 
-def roll_stop_at(s, game, target_score):
+@depends_on('turn_score')
+def roll_stop_at(s, game, target_score, hotdice: bool = None):
     """
     Roll again unless target score is reached / passed
     """
-    if s.turn_score < target_score:
-        return False
-    else:
-        return True
+    return s.turn_score < target_score
 
+@depends_on('turn_score')
 def roll_stop_at_unless_hotdice(s, game, target_score: int = None, hotdice: bool = None):
     """
     Roll again unless target score is reached / passed or if you have hotdice
@@ -28,23 +40,45 @@ def roll_stop_at_unless_hotdice(s, game, target_score: int = None, hotdice: bool
     else:
         return False
 
-def score_triple_2_bad(s, scores, game):
+@depends_on('total_score', 'turn_score', 'turn_remaining_dice')
+def roll_fewest_turns(s, game, hotdice: bool = None, policy = None):
+    """
+    Roll again if that reaches the game's winning score in the fewest turns on average.
+    
+    Uses the solved full game policy (see solver.solve_game), which is solved the first time it's 
+    needed, unless a policy is given
+    """
+    import solver
+    policy = solver.game_policy(game.winning_score) if policy is None else policy
+    return solver.game_roll_again(policy, s.total_score, s.turn_score, s.turn_remaining_dice)
+
+def roll_win_most(s, game, policy, hotdice: bool = None):
+    """
+    Roll again if that wins a two player game (game.players) most often, according to a solved 
+    duel.DuelPolicy (see duel.solve, which takes too long to do on the fly, so the policy has to be 
+    given). This depends on the opponent too, so its decisions can't be cached
+    """
+    import duel
+    opponent_total, first = duel.opponent(s, game)
+    return duel.duel_roll_again(policy, s.total_score, opponent_total, first, s.turn_score, 
+                                s.turn_remaining_dice)
+
+@depends_on()
+def score_triple_2_bad(s, options, game):
     """
     Reduce the attractiveness of triple 2s
     """
-    scores.loc[scores.Roll.map(lambda x: x.count(2) == 3)]['Rating'] -= 1
-    return scores
+    return [-1 if option.roll.count(2) == 3 else 0 for option in options]
 
-def score_big_better(s, scores, game):
+@depends_on()
+def score_big_better(s, options, game):
     """
     Higher scores get better ratings. Simple.
     """
-    # should already be sorted, but just in case
-    # make the rating more negative for worse scores
-    scores['Rating'] = scores.sort_values(['Score']).reset_index().index * -1
-    return scores
+    return [option.score for option in options]
 
-def score_best_per_dice(s, scores, game, marginal_value_of_die=67):
+@depends_on()
+def score_best_per_dice(s, options, game, marginal_value_of_die=67):
     """
     Higher scores get better ratings, but are made a bit smaller if a score requires many dice
 
@@ -56,45 +90,47 @@ def score_best_per_dice(s, scores, game, marginal_value_of_die=67):
         Doing so would require a bunch of additional work, as ev | #die is strategy dependent
     
     """
-    # scores = score_big_better(s, scores, game)
-    
-    # scores = scores.Score - (scores.Remaining.map(len) * marginal_value_of_die)
-    
-    # create a roll "price" from the len remaining die, add that price to the Score and rank it.
-    scores['Rating'] = ((scores.Remaining.map(len) * marginal_value_of_die) + scores.Score).rank()
-    
-    # norm to make 0 the max
-    scores['Rating']= scores.Rating - scores.Rating.max()
-    
-    scores['Len'] = scores.apply(lambda x: len(x.Roll), axis=1)
-    
-    # prioritize rating over length, but if the ratings are the same, choose the shortest length
-    scores = scores.sort_values('Len', ascending=False).sort_values('Rating', ascending=False).drop(columns=['Len'])
-    
-    return scores
+    # create a roll "price" from the len remaining die, add that price to the Score.
+    # scores are multiples of 50, so two options can only tie if they use the same number of dice
+    return [len(option.remaining) * marginal_value_of_die + option.score for option in options]
 
-def score_best_per_dice_exclude_hot_dice(s, scores, game, discount_factor=1):
+@depends_on()
+def score_best_per_dice_exclude_hot_dice(s, options, game, marginal_value_of_die=67):
     """
     Same as best scores, but don't discount things that would give us hot dice
     """
+    ratings = score_best_per_dice(s, options, game, marginal_value_of_die=marginal_value_of_die)
     
-    scores_weighted = score_best_per_dice(s, 
-                                          scores.loc[scores.Roll.map(lambda x: len(x) < NUMBER_OF_DICE)], 
-                                          game)
-    scores_weighted = pd.concat([scores_weighted, scores.loc[~scores.index.isin(scores_weighted.index)]
-                                ]).sort_values(['Rating', 'Score'], ascending=False)
-    return scores
+    # hot dice gives us all of the dice back, so price it as though no dice were used
+    return [score + NUMBER_OF_DICE * marginal_value_of_die if not option.remaining else score 
+            for score, option in zip(ratings, options)]
 
-def score_avoid_fives(s, scores, game, five_cost = 1):
+@depends_on()
+def score_avoid_fives(s, options, game, five_cost = 1):
     """
     When possible, don't take single fives
     """
-    non_multiples = scores.loc[scores.Type != 'multiple']
-    
-    fives_cost['Rating'] += non_multiples.apply(lambda x: x.Roll.count(5) * five_cost * -1, axis=1)
-    
-    non_multiples_discounted =  non_multiples.Rating - fives_cost
-    
-    scores = non_multiples_discounted.join(scores.loc[~non_multiples_discounted], how='outer')
-    
-    return scores
\ No newline at end of file
+    return [0 if option.type == 'multiple' else option.roll.count(5) * five_cost * -1 
+            for option in options]
+
+@depends_on('total_score', 'turn_score')
+def score_fewest_turns(s, options, game, policy = None):
+    """
+    Take the option that leaves the fewest expected turns to reach the winning score, according to the
+    solved full game policy (see roll_fewest_turns)
+    """
+    import solver
+    policy = solver.game_policy(game.winning_score) if policy is None else policy
+    return [-solver.game_value(policy, s.total_score, s.turn_score + option.score, len(option.remaining))
+            for option in options]
+
+def score_win_most(s, options, game, policy):
+    """
+    Take the option that wins a two player game most often, according to a solved duel.DuelPolicy
+    (see roll_win_most), which has to have been solved with values=True
+    """
+    import duel
+    opponent_total, first = duel.opponent(s, game)
+    return [duel.duel_value(policy, s.total_score, opponent_total, first, s.turn_score + option.score,
+                            len(option.remaining))
+            for option in options]
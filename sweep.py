@@ -0,0 +1,287 @@
+"""
+Run hotdice.main style sweeps over a grid of player configurations on every core.
+
+The games of each configuration are cut into chunks (work units) that are spread over a process pool.
+Every chunk gets its own seed, spawned from a single root seed, so a sweep gives the same results no
+matter how many processes run it or in which order the chunks finish.
+"""
+
+import os
+import play
+import batch
+import stats
+import policy
+import strategy
+import tempfile
+import itertools as it
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from dice import NumpyDice
+from concurrent.futures import ProcessPoolExecutor
+from hotdice import Game, Player, COLUMNS, TARGETS
+
+# everything needed to make a Player. Strategies must be module level functions so they can be sent
+# to the worker processes
+PlayerConfig = namedtuple('PlayerConfig', ['name', 'roll_strategy', 'score_strategy',
+                                           'roll_kwargs', 'score_kwargs'])
+
+# a chunk of games of a single configuration. policy_path is the config's compiled policy (see
+# save_policies), or None to use the strategies
+WorkUnit = namedtuple('WorkUnit', ['config', 'n_games', 'seed', 'winning_score', 'use_batch',
+                                   'policy_path'])
+
+def grid(roll_strategies, score_strategies, roll_kwargs=({},), score_kwargs=({},)):
+    """
+    Every combination of the given strategies and kwargs as a list of PlayerConfigs.
+
+    >>> configs = grid([strategy.roll_stop_at_unless_hotdice], [strategy.score_big_better],
+    ...                roll_kwargs=[{'target_score': 300}, {'target_score': 400}])
+    >>> [config.name for config in configs]
+    ['roll_stop_at_unless_hotdice(target_score=300)-score_big_better()', 'roll_stop_at_unless_hotdice(target_score=400)-score_big_better()']
+    """
+    configs = []
+    for roll_strategy, score_strategy, roll_kw, score_kw in it.product(roll_strategies,
+                                                                       score_strategies,
+                                                                       roll_kwargs, score_kwargs):
+        name = f'{describe(roll_strategy, roll_kw)}-{describe(score_strategy, score_kw)}'
+        configs.append(PlayerConfig(name, roll_strategy, score_strategy, dict(roll_kw),
+                                    dict(score_kw)))
+    return configs
+
+def describe(fn, kwargs):
+    """
+    A short name for a strategy called with kwargs
+    """
+    args = ', '.join(f'{key}={value}' for key, value in kwargs.items())
+    return f'{fn.__name__}({args})'
+
+def make_player(config, policy_path=None):
+    """
+    Make a Player from a PlayerConfig, with the policy saved at policy_path if there is one
+    """
+    return Player(config.name, config.roll_strategy, config.score_strategy,
+                  roll_kwargs=config.roll_kwargs, score_kwargs=config.score_kwargs,
+                  policy=None if policy_path is None else policy.load(policy_path))
+
+def save_policies(configs, game, directory):
+    """
+    Compile the policy of every config once and save it in directory, so that the worker processes
+    map a single shared copy of each (see policy.load) instead of all compiling their own. Returns
+    the list of paths, in config order (configs can share a name, so they are kept by position)
+    """
+    paths = []
+    for number, config in enumerate(configs):
+        paths.append(os.path.join(directory, f'policy{number}.bin'))
+        policy.save(policy.compile_policy(make_player(config), game), paths[-1])
+    return paths
+
+def config_key(config):
+    """
+    The values of the stats.KEY_COLUMNS in the result rows of a config
+    """
+    return (config.name, config.roll_kwargs.get('target_score'), config.roll_strategy.__name__,
+            config.score_strategy.__name__)
+
+def play_chunk(work):
+    """
+    Play the games of a single work unit. Returns a list of result rows (see hotdice.COLUMNS)
+    """
+    config = work.config
+    player = make_player(config, work.policy_path)
+    game = Game(winning_score=work.winning_score)
+    info = list(config_key(config))
+
+    if work.use_batch:
+        games = batch.play(game, player, work.n_games, seed=work.seed)
+        return [info + [int(turns), int(busts), int(rolls)]
+                for turns, busts, rolls in zip(games.turns, games.busts, games.rolls)]
+
+    dice = NumpyDice(seed=work.seed)
+    rows = []
+    for _ in range(work.n_games):
+        player.reset()
+        player = play.play(game, player, dice=dice)
+        rows.append(info + [player.number_of_turns, player.number_of_busts, player.number_of_rolls])
+    return rows
+
+def aggregate_chunk(work):
+    """
+    Play the games of a single work unit. Returns a stats.Aggregator of their results
+    """
+    return stats.aggregate(play_chunk(work))
+
+def chunk_sizes(sample, chunk_size):
+    return [min(chunk_size, sample - start) for start in range(0, sample, chunk_size)]
+
+def work_units(configs, sample, chunk_size, seed, winning_score, use_batch, policy_paths=None):
+    """
+    Cut the games of every config into chunks of at most chunk_size games, each with its own seed.
+    policy_paths are the paths of the configs' policies, in config order (see save_policies)
+    """
+    sizes = chunk_sizes(sample, chunk_size)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(configs) * len(sizes)))
+    policy_paths = [None] * len(configs) if policy_paths is None else policy_paths
+    return [WorkUnit(config, size, next(seeds), winning_score, use_batch, path)
+            for config, path in zip(configs, policy_paths) for size in sizes]
+
+def run(configs, sample=10000, chunk_size=500, processes=None, seed=None, game=None,
+        use_batch=False, aggregate=False):
+    """
+    Play sample games with every config, spread over a pool of processes.
+
+    Arguments:
+    configs - a list of PlayerConfigs (see grid)
+    sample - the number of games to play with each config
+    chunk_size - the number of games in each work unit
+    processes - the number of worker processes (default: one per core)
+    seed - the root seed; the same seed always gives the same results
+    game - the Game to play (default: Game())
+    use_batch - play the games with batch.play, which needs strategies that can be compiled (see
+                policy). Each config is compiled once, and the workers share it (see save_policies)
+    aggregate - only keep summaries of the results, each worker summarizes its own games
+
+    Returns a DataFrame with hotdice.COLUMNS and one row per game, in config order. With aggregate,
+    returns a stats.Aggregator of every game instead (its to_frame has a row per config)
+    """
+    game = Game() if game is None else game
+    processes = os.cpu_count() if processes is None else processes
+    play_work = aggregate_chunk if aggregate else play_chunk
+
+    with tempfile.TemporaryDirectory() as directory:
+        policy_paths = save_policies(configs, game, directory) if use_batch else None
+        work = work_units(configs, sample, chunk_size, seed, game.winning_score, use_batch, 
+                          policy_paths)
+        if processes == 1:
+            chunks = list(map(play_work, work))
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                chunks = list(pool.map(play_work, work))
+
+    if aggregate:
+        aggregator = stats.Aggregator()
+        for chunk in chunks:
+            aggregator.merge(chunk)
+        return aggregator
+
+    results = pd.DataFrame([row for chunk in chunks for row in chunk], columns=COLUMNS)
+    return results.astype({'Turns':int, 'Busts':int, 'Rolls':int})
+
+def aggregator_count(aggregator, key):
+    """
+    The number of games of a config in an aggregator
+    """
+    summaries = aggregator.summaries.get(key)
+    return summaries[0].moments.count if summaries else 0
+
+def adaptive(configs, tolerance=0.1, batch_size=1000, max_games=100_000, chunk_size=500,
+             processes=None, seed=None, game=None, use_batch=False, column='Turns', confidence=0.95,
+             elimination='confidence', keep=0.5):
+    """
+    Play games with every config in rounds of batch_size games, until the confidence interval of the
+    mean of column (by default, the turns to win) is narrow enough, instead of a fixed sample.
+
+    Configs that are clearly worse (a higher mean) than the best can be dropped along the way, so
+    the games go to the configs that are still in the running:
+        elimination='confidence' - drop a config once the low end of its confidence interval is
+                                   above the high end of the best config's
+        elimination='halving' - successive halving, after every round keep only the best keep
+                                fraction of the configs still playing
+        elimination=None - play every config until it's done
+
+    Arguments:
+    configs - a list of PlayerConfigs (see grid)
+    tolerance - stop a config once the half width of its confidence interval is at most this
+    batch_size - the number of games to play with each config still playing, per round
+    max_games - the most games to play with any config
+    chunk_size, processes, seed, game, use_batch - as for run. With a seed the rounds are the same
+                                                   every time
+    column - the column whose mean is estimated (lower is better)
+    confidence - the confidence of the intervals
+    elimination, keep - see above
+
+    Returns the DataFrame of stats.Aggregator.to_frame with the Status of each config: converged,
+    max_games or dropped
+    """
+    if elimination not in ('confidence', 'halving', None):
+        raise ValueError(f'unknown elimination {elimination}')
+    game = Game() if game is None else game
+    processes = os.cpu_count() if processes is None else processes
+    config_seeds = np.random.SeedSequence(seed).spawn(len(configs))
+    keys = [config_key(config) for config in configs]
+    if len(set(keys)) < len(keys):
+        # their games would all be summarized together
+        raise ValueError('every config needs its own name')
+    position = stats.VALUE_COLUMNS.index(column)
+    aggregator = stats.Aggregator()
+    status = {}
+
+    def interval(i):
+        moments = aggregator.summaries[keys[i]][position].moments
+        return (moments.mean, *moments.confidence_interval(confidence), moments.count)
+
+    directory = tempfile.TemporaryDirectory()
+    policy_paths = save_policies(configs, game, directory.name) if use_batch else None
+    pool = ProcessPoolExecutor(processes) if processes != 1 else None
+    try:
+        active = list(range(len(configs)))
+        while active:
+            work = []
+            for i in active:
+                sizes = chunk_sizes(min(batch_size, max_games - aggregator_count(aggregator, keys[i])),
+                                    chunk_size)
+                # spawn carries on from the children already spawned, so every round gets new seeds
+                path = None if policy_paths is None else policy_paths[i]
+                work += [WorkUnit(configs[i], size, child, game.winning_score, use_batch, path)
+                         for size, child in zip(sizes, config_seeds[i].spawn(len(sizes)))]
+            for chunk in (pool.map(aggregate_chunk, work) if pool else map(aggregate_chunk, work)):
+                aggregator.merge(chunk)
+
+            intervals = {i: interval(i) for i in range(len(configs)) if status.get(i) != 'dropped'}
+            for i in active:
+                mean, low, high, count = intervals[i]
+                if (high - low) / 2 <= tolerance:
+                    status[i] = 'converged'
+                elif count >= max_games:
+                    status[i] = 'max_games'
+            active = [i for i in active if i not in status]
+
+            if elimination == 'confidence':
+                best_high = min(high for mean, low, high, count in intervals.values())
+                dropped = [i for i in active if intervals[i][1] > best_high]
+            elif elimination == 'halving':
+                ranked = sorted(active, key=lambda i: intervals[i][0])
+                dropped = ranked[max(1, int(np.ceil(keep * len(ranked)))):]
+            else:
+                dropped = []
+            for i in dropped:
+                status[i] = 'dropped'
+            active = [i for i in active if i not in status]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        directory.cleanup()
+
+    # to_frame has a row per key of the aggregator, in order
+    statuses = {key: status[i] for i, key in enumerate(keys)}
+    results = aggregator.to_frame(confidence=confidence)
+    results['Status'] = [statuses[key] for key in aggregator.summaries]
+    return results
+
+def main(sample=10000, processes=None, seed=None, aggregate=False, tolerance=None):
+    """
+    The hotdice.main sweep, on every core. With aggregate, returns a summary per config instead.
+    With a tolerance, plays each config until its mean turns are known to within tolerance (see
+    adaptive), using at most sample games
+    """
+    configs = grid([strategy.roll_stop_at_unless_hotdice],
+                   [strategy.score_best_per_dice_exclude_hot_dice],
+                   roll_kwargs=[{'target_score':target_score} for target_score in TARGETS])
+    if tolerance is not None:
+        return adaptive(configs, tolerance=tolerance, max_games=sample, processes=processes, 
+                        seed=seed)
+    results = run(configs, sample=sample, processes=processes, seed=seed, aggregate=aggregate)
+    return results.to_frame() if aggregate else results
+
+if __name__ == '__main__':
+    print(main())
@@ -0,0 +1,92 @@
+"""
+Flat binary files of named arrays that many processes can open at once without copying them.
+
+A file is a small header followed by the raw arrays:
+    MAGIC - 8 bytes
+    the length of the header - 8 bytes, little endian
+    the header - JSON, {'meta': {...}, 'arrays': {name: {'dtype', 'shape', 'offset'}}}
+    the arrays, each at its offset from the first multiple of ALIGNMENT bytes after the header (and
+    at multiples of ALIGNMENT themselves)
+
+open_table memory maps the file (np.memmap) and the arrays are views into it, so opening is instant no
+matter how big the arrays are, only the pages that are used are ever read, and every process that opens
+the same file shares a single copy in the page cache. The arrays are read only.
+
+Files are written to a temporary file and then renamed into place, so a process never opens half a file.
+"""
+
+import os
+import json
+import numpy as np
+from collections import namedtuple
+
+MAGIC = b'HOTDICE\x01'
+ALIGNMENT = 64
+
+# arrays - a dictionary of name: array
+# meta - the dictionary of JSON values saved with them
+Table = namedtuple('Table', ['arrays', 'meta'])
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write(path, arrays, meta=None):
+    """
+    Write a dictionary of name: array to path, with a dictionary of JSON values as meta
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = aligned(offset + array.nbytes)
+    header = json.dumps({'meta': meta or {}, 'arrays': layout}).encode()
+    start = aligned(len(MAGIC) + 8 + len(header))
+
+    temporary = f'{path}.tmp{os.getpid()}'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+        for name, array in arrays.items():
+            f.seek(start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+    os.replace(temporary, path)
+
+def read_header(path):
+    """
+    The header of a file written by write and where its arrays start, or (None, None) if it isn't one
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None, None
+        length = int.from_bytes(f.read(8), 'little')
+        return json.loads(f.read(length)), aligned(len(MAGIC) + 8 + length)
+
+# the tables this process has open, by path, with the size and modification time they were opened at
+OPEN = {}
+
+def open_table(path):
+    """
+    Memory map a file written by write. Returns a Table, or None if path isn't one.
+
+    Each process only maps a file once (until it's rewritten)
+    """
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    if path in OPEN and OPEN[path][0] == version:
+        return OPEN[path][1]
+
+    header, start = read_header(path)
+    if header is None:
+        return None
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, description in header['arrays'].items():
+        dtype, shape = np.dtype(description['dtype']), tuple(description['shape'])
+        if np.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=mapped,
+                                      offset=start + description['offset'])
+    table = Table(arrays, header['meta'])
+    OPEN[path] = (version, table)
+    return table
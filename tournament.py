@@ -0,0 +1,86 @@
+"""
+Round-robin tournaments between strategies.
+
+Every pair of player configurations (see sweep.grid) plays a batch of two player games, once with each
+configuration going first, using batch.play_matches. The results give the win rate of every strategy
+against every other, and how much going first is worth.
+"""
+
+import os
+import batch
+import tempfile
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from hotdice import Game
+from sweep import make_player, save_policies
+
+# the matches between two configs, with first going first. The policy paths are where their compiled
+# policies were saved (see sweep.save_policies)
+Pairing = namedtuple('Pairing', ['first', 'second', 'n_matches', 'seed', 'winning_score',
+                                 'final_round', 'first_policy', 'second_policy'])
+
+def play_pairing(pairing):
+    """
+    Play the matches of a single pairing. Returns the number of wins of the player who went first
+    """
+    game = Game(winning_score=pairing.winning_score,
+                players=[make_player(pairing.first, pairing.first_policy),
+                         make_player(pairing.second, pairing.second_policy)],
+                final_round=pairing.final_round)
+    matches = batch.play_matches(game, pairing.n_matches, seed=pairing.seed)
+    return int(np.sum(matches.winner == 0))
+
+def round_robin(configs, n_matches=1000, seed=None, processes=1, game=None):
+    """
+    Play n_matches matches between every ordered pair of configs (so each pair plays 2 * n_matches
+    matches, half with each going first).
+
+    Arguments:
+    configs - a list of PlayerConfigs. Their strategies need to be compilable (see policy)
+    n_matches - the number of matches per ordered pair
+    seed - the root seed; every pairing gets its own seed spawned from it
+    processes - the number of worker processes, None for one per core
+    game - a Game with the winning_score and final_round rules to use (default: Game())
+
+    Returns a DataFrame with a row per ordered pair: First, Second, Matches, FirstWins
+    """
+    game = Game() if game is None else game
+    pairs = [(first, second) for first in range(len(configs)) for second in range(len(configs))
+             if first != second]
+    seeds = np.random.SeedSequence(seed).spawn(len(pairs))
+    processes = os.cpu_count() if processes is None else processes
+
+    # every config is compiled once, not once per pairing
+    with tempfile.TemporaryDirectory() as directory:
+        paths = save_policies(configs, game, directory)
+        pairings = [Pairing(configs[first], configs[second], n_matches, pair_seed,
+                            game.winning_score, game.final_round, paths[first], paths[second])
+                    for (first, second), pair_seed in zip(pairs, seeds)]
+        if processes == 1:
+            wins = list(map(play_pairing, pairings))
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                wins = list(pool.map(play_pairing, pairings))
+
+    return pd.DataFrame({'First':[pairing.first.name for pairing in pairings],
+                         'Second':[pairing.second.name for pairing in pairings],
+                         'Matches':n_matches,
+                         'FirstWins':wins})
+
+def win_rates(results):
+    """
+    The win rate of every config (rows) against every other config (columns), whoever went first
+    """
+    as_first = results.rename(columns={'First':'Player', 'Second':'Opponent', 'FirstWins':'Wins'})
+    as_second = results.rename(columns={'Second':'Player', 'First':'Opponent'})
+    as_second['Wins'] = as_second.Matches - as_second.FirstWins
+    both = pd.concat([as_first, as_second[as_first.columns]]).groupby(['Player', 'Opponent']).sum()
+    return (both.Wins / both.Matches).unstack('Opponent')
+
+def first_player_advantage(results):
+    """
+    The fraction of all matches won by the player who went first
+    """
+    return results.FirstWins.sum() / results.Matches.sum()
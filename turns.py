@@ -0,0 +1,237 @@
+"""
+Play games a whole turn at a time.
+
+With a strategy that only depends on the turn score and the remaining dice (anything that can be
+compiled into a policy, see policy.py), every turn is played the same way whatever the total score, so
+the outcome of a turn (the points banked, 0 for a bust, and the number of times the player rolled
+again) has a fixed distribution. turn_outcomes works it out exactly, by pushing the probability of
+every (turn score, dice, rolls) state forward through every roll (each roll that scores adds at least
+SCORE_UNIT, so the states can be done in order of turn score). A turn that keeps getting hot dice can go
+on forever, so once less than tolerance of the probability is still rolling, those turns are stopped
+where they are.
+
+A game is then one draw from that distribution per turn, made in constant time with the alias method
+(see alias_table), instead of rolling, scoring and asking the strategies over and over. play and
+play_matches play games the same way as batch.play and batch.play_matches, and return the same results.
+"""
+
+import numpy as np
+import policy
+import probability
+from collections import namedtuple
+from batch import Games, Matches, player_policy
+from score import SCORE_UNIT
+from core import NUMBER_OF_DICE
+
+# the distribution of the outcome of a turn, an entry per outcome
+# banked - the points banked (0 for a bust)
+# rolls - the number of times the player rolled again
+# probability - the probability of the outcome
+# truncated - the probability of the turns that were stopped early (see turn_outcomes)
+TurnOutcomes = namedtuple('TurnOutcomes', ['banked', 'rolls', 'probability', 'truncated'])
+
+# the outcomes of a turn, with the alias table to draw them with (see alias_table)
+Sampler = namedtuple('Sampler', ['outcomes', 'accept', 'alias'])
+
+def roll_moves(compiled, row):
+    """
+    The probability of each (score, dice left) of the option the policy chooses in score row row, by
+    the number of dice rolled. Returns a list of (units scored, dice left, probability) per number of
+    dice (busts score 0)
+    """
+    rolls, _ = policy.rolls_and_index()
+    moves = [[] for _ in range(NUMBER_OF_DICE + 1)]
+    for column, roll in enumerate(rolls):
+        units = int(compiled.option_score[row, column]) // SCORE_UNIT
+        left = int(compiled.option_remaining[row, column])
+        moves[len(roll)].append((units, left, float(probability.roll_probability(roll))))
+
+    merged = []
+    for n_moves in moves:
+        chances = {}
+        for units, left, chance in n_moves:
+            chances[units, left] = chances.get((units, left), 0) + chance
+        merged.append([(units, left, chance) for (units, left), chance in chances.items()])
+    return merged
+
+def turn_outcomes(compiled, tolerance=1e-12, max_rolls=200):
+    """
+    The exact distribution of the outcome of a turn played with a compiled policy. Returns
+    TurnOutcomes
+
+    Arguments:
+    compiled - a policy.Policy
+    tolerance - stop the turns that are still rolling once they have less probability than this
+    max_rolls - the most roll agains to keep track of (turns with more are counted as max_rolls)
+    """
+    score_rows, roll_rows = len(compiled.option_score), len(compiled.roll_again)
+    moves = {}
+    # the probability of being about to roll, by [turn score units, dice, roll agains so far]
+    pending = np.zeros((roll_rows + 1, NUMBER_OF_DICE + 1, max_rolls + 1))
+    pending[0, NUMBER_OF_DICE, 0] = 1
+    banked = np.zeros_like(pending[:, 0])
+    busted = np.zeros(max_rolls + 1)
+    rolling = 1.0
+
+    t = 0
+    while rolling >= tolerance and t < len(pending):
+        row = int(policy.bucket(t * SCORE_UNIT, score_rows))
+        if row not in moves:
+            moves[row] = roll_moves(compiled, row)
+        for dice in range(1, NUMBER_OF_DICE + 1):
+            state = pending[t, dice]
+            mass = state.sum()
+            if mass == 0:
+                continue
+            rolling -= mass
+            for units, left, chance in moves[row][dice]:
+                if units == 0:
+                    busted += chance * state
+                    continue
+                after = t + units
+                if after >= len(pending):
+                    grow = after + 1 - len(pending) + roll_rows
+                    pending = np.concatenate([pending, np.zeros((grow,) + pending.shape[1:])])
+                    banked = np.concatenate([banked, np.zeros((grow, max_rolls + 1))])
+                row_after = int(policy.bucket(after * SCORE_UNIT, roll_rows))
+                if compiled.roll_again[row_after, left]:
+                    again = pending[after, left or NUMBER_OF_DICE]
+                    again[1:] += chance * state[:-1]
+                    again[-1] += chance * state[-1]
+                    rolling += chance * state.sum()
+                else:
+                    banked[after] += chance * state
+        t += 1
+
+    # stop whatever is still rolling where it is
+    truncated = pending[t:].sum()
+    banked[t:] += pending[t:].sum(axis=1)
+
+    units, rolls = np.nonzero(banked)
+    bust_rolls = np.nonzero(busted)[0]
+    return TurnOutcomes(np.concatenate([np.zeros(len(bust_rolls), dtype=np.int64),
+                                        units * SCORE_UNIT]),
+                        np.concatenate([bust_rolls, rolls]),
+                        np.concatenate([busted[bust_rolls], banked[units, rolls]]),
+                        float(truncated))
+
+def alias_table(chances):
+    """
+    Vose's alias table of a categorical distribution: draw an entry i uniformly, then keep it with
+    probability accept[i] or else take alias[i]. Returns (accept, alias)
+
+    >>> accept, alias = alias_table([0.5, 0.25, 0.25])
+    >>> [(accept[i] + sum(1 - accept[j] for j in range(3) if alias[j] == i)) / 3 for i in range(3)]
+    [0.5, 0.25, 0.25]
+    """
+    scaled = np.asarray(chances, dtype=float) * len(chances) / np.sum(chances)
+    accept = np.ones(len(scaled))
+    alias = np.arange(len(scaled))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        accept[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+    # whatever is left over is 1, give or take rounding
+    return accept, alias
+
+def make_sampler(compiled, tolerance=1e-12):
+    """
+    A Sampler of the turns played with a compiled policy
+    """
+    outcomes = turn_outcomes(compiled, tolerance)
+    return Sampler(outcomes, *alias_table(outcomes.probability))
+
+def draw(sampler, rng, n):
+    """
+    The indexes into sampler.outcomes of n turns
+    """
+    index = rng.integers(len(sampler.accept), size=n)
+    return np.where(rng.random(n) < sampler.accept[index], index, sampler.alias[index])
+
+# Samplers by player strategies (and kwargs) and winning score, made the first time they are needed
+SAMPLERS = {}
+
+def player_sampler(player, game):
+    """
+    The Sampler of the player's turns. Players without a compiled policy have theirs compiled (see
+    batch.player_policy), and their Sampler is kept for the next player with the same strategies
+    """
+    if player.policy is not None:
+        return make_sampler(player.policy)
+    key = (player.roll_strategy, player.score_strategy, repr(player.roll_kwargs),
+           repr(player.score_kwargs), game.winning_score)
+    if key not in SAMPLERS:
+        SAMPLERS[key] = make_sampler(player_policy(player, game))
+    return SAMPLERS[key]
+
+def play(game, player, n_games, seed=None):
+    """
+    Play n_games games of hot dice with the player's strategies, a whole turn at a time. The same as
+    batch.play (and just as random, but not the same games for the same seed)
+
+    Returns a batch.Games tuple of arrays
+    """
+    sampler = player_sampler(player, game)
+    outcomes = sampler.outcomes
+    rng = np.random.default_rng(seed)
+
+    total_score = np.zeros(n_games, dtype=np.int64)
+    turns = np.zeros(n_games, dtype=np.int64)
+    busts = np.zeros(n_games, dtype=np.int64)
+    rolls = np.zeros(n_games, dtype=np.int64)
+
+    active = np.arange(n_games)
+    while len(active):
+        drawn = draw(sampler, rng, len(active))
+        total_score[active] += outcomes.banked[drawn]
+        busts[active] += outcomes.banked[drawn] == 0
+        rolls[active] += outcomes.rolls[drawn]
+        turns[active] += 1
+        active = active[total_score[active] < game.winning_score]
+
+    return Games(turns, busts, rolls, total_score)
+
+def play_matches(game, n_matches, seed=None, first=0):
+    """
+    Play n_matches games of hot dice between game.players, a whole turn at a time. The same as
+    batch.play_matches
+
+    Returns a batch.Matches tuple of arrays
+    """
+    n_players = len(game.players)
+    samplers = [player_sampler(player, game) for player in game.players]
+    rng = np.random.default_rng(seed)
+
+    seat = np.full(n_matches, first, dtype=np.int64)
+    closer = np.full(n_matches, -1, dtype=np.int64)
+    total_score = np.zeros((n_matches, n_players), dtype=np.int64)
+    turns = np.zeros((n_matches, n_players), dtype=np.int64)
+    busts = np.zeros((n_matches, n_players), dtype=np.int64)
+    rolls = np.zeros((n_matches, n_players), dtype=np.int64)
+
+    active = np.arange(n_matches)
+    while len(active):
+        for n, sampler in enumerate(samplers):
+            playing = active[seat[active] == n]
+            drawn = draw(sampler, rng, len(playing))
+            total_score[playing, n] += sampler.outcomes.banked[drawn]
+            busts[playing, n] += sampler.outcomes.banked[drawn] == 0
+            rolls[playing, n] += sampler.outcomes.rolls[drawn]
+            turns[playing, n] += 1
+            reached = (closer[playing] < 0) & (total_score[playing, n] >= game.winning_score)
+            closer[playing[reached]] = n
+        seat[active] = (seat[active] + 1) % n_players
+
+        # as in batch.play_matches
+        over = closer[active] >= 0
+        if game.final_round:
+            over &= seat[active] == closer[active]
+        active = active[~over]
+
+    in_turn_order = np.roll(total_score, -first, axis=1)
+    winner = (np.argmax(in_turn_order, axis=1) + first) % n_players
+    return Matches(winner, turns, busts, rolls, total_score)
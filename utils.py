@@ -26,6 +26,67 @@ def powerset(iterable, min_len=1, max_len=None):
     
     return it.chain.from_iterable(it.combinations(s, r) for r in range(min_len, max_len + 1))
 
+def sub_multisets(counts, max_count=None, min_len=1):
+    """
+    Every sub-multiset of a multiset, as a generator of tuples. Unlike the powerset of the items, each 
+    sub-multiset comes up once, no matter how many of an item there are
+    
+    Args:
+    counts -- a dictionary of item: how many of that item there are
+    max_count -- the most of each item to take
+    min_len -- the smallest sub-multiset to return
+    
+    >>> list(sub_multisets({1: 2, 5: 1}))
+    [(5,), (1,), (1, 5), (1, 1), (1, 1, 5)]
+    
+    >>> list(sub_multisets({1: 3}, max_count=2))
+    [(1,), (1, 1)]
+    """
+    items = list(counts.items())
+    
+    def extend(i, chosen):
+        if i == len(items):
+            if len(chosen) >= min_len:
+                yield tuple(chosen)
+            return
+        item, count = items[i]
+        for n in range(min(count, count if max_count is None else max_count) + 1):
+            yield from extend(i + 1, chosen + [item] * n)
+    
+    return extend(0, [])
+
+def disjoint_combinations(parts, whole, min_len=1):
+    """
+    Every combination of parts (rolls) whose dice all fit in whole at the same time, as a generator
+    of tuples of parts, in the same order as powerset(parts, min_len).
+    
+    Combinations are built up a part at a time and a part is only added if its dice are still left in 
+    whole, so combinations that don't fit are never made. Every part of a combination that fits 
+    also fits, so there's no need to look at bigger combinations once none of a size fit.
+    
+    >>> list(disjoint_combinations([(1,), (5,), (1, 1, 1)], (1, 1, 1, 5)))
+    [((1,),), ((5,),), ((1, 1, 1),), ((1,), (5,)), ((5,), (1, 1, 1))]
+    """
+    parts = list(parts)
+    packed_parts = [pack(part) for part in parts]
+    
+    def extend(start, chosen, rest, size):
+        if len(chosen) == size:
+            yield tuple(parts[i] for i in chosen)
+            return
+        for i in range(start, len(parts) - (size - len(chosen)) + 1):
+            if packed_contains(rest, packed_parts[i]):
+                yield from extend(i + 1, chosen + [i], rest - packed_parts[i], size)
+    
+    packed_whole = pack(whole)
+    for size in range(max(min_len, 1), len(parts) + 1):
+        found = False
+        for combination in extend(0, [], packed_whole, size):
+            found = True
+            yield combination
+        if not found:
+            break
+    
 def merge_tuple(tuples):
     """
     Accept a tuple of tuples. Merge the innermost into one
@@ -65,10 +126,113 @@ def merge_subtuples(iterable):
         yield merge_tuple(inner_tuple)
             
             
+# Dice multisets can be packed into an int, with a 4 bit field per face: the count of 0s in bits 0-3,
+# the count of 1s in bits 4-7, etc. Counts use the low 3 bits of a field, the top bit is a guard that
+# stops subtraction borrowing from the next field. So subset tests, subtraction, intersection and the
+# number of dice each take a few integer operations, whatever the size of the roll.
+FIELD_BITS = 4
+MAX_PACKED_FACE = 15
+MAX_PACKED_COUNT = 7
+# every count field, and every guard bit
+FIELDS = sum(MAX_PACKED_COUNT << (FIELD_BITS * face) for face in range(MAX_PACKED_FACE + 1))
+GUARDS = sum(1 << (FIELD_BITS * face + 3) for face in range(MAX_PACKED_FACE + 1))
+# multiplying by this sums every field into the top field (as long as the sum is under 16)
+FIELD_ONES = sum(1 << (FIELD_BITS * face) for face in range(MAX_PACKED_FACE + 1))
+
+def pack(roll):
+    """
+    Pack a roll (faces from 0 to 15, at most 7 of each) into an int. Order doesn't matter
+    
+    >>> pack((1, 5, 5)) == pack((5, 1, 5))
+    True
+    >>> pack((1, 5, 5))
+    2097168
+    """
+    code = 0
+    for die in roll:
+        if not 0 <= die <= MAX_PACKED_FACE or packed_count(code, die) == MAX_PACKED_COUNT:
+            raise ValueError(f'{roll} can not be packed')
+        code += 1 << (FIELD_BITS * die)
+    return code
+
+def unpack(code):
+    """
+    The sorted roll of a packed code
+    
+    >>> unpack(pack((5, 1, 5)))
+    (1, 5, 5)
+    """
+    roll = []
+    face = 0
+    while code:
+        roll += [face] * (code & MAX_PACKED_COUNT)
+        code >>= FIELD_BITS
+        face += 1
+    return tuple(roll)
+
+def packed_count(code, face):
+    """
+    The number of dice showing face
+    
+    >>> packed_count(pack((2, 2, 3)), 2)
+    2
+    """
+    return (code >> (FIELD_BITS * face)) & MAX_PACKED_COUNT
+
+def packed_size(code):
+    """
+    The number of dice in a packed roll (of at most 15 dice)
+    
+    >>> packed_size(pack((1, 1, 4, 6, 6, 6)))
+    6
+    """
+    return ((code * FIELD_ONES) >> (FIELD_BITS * MAX_PACKED_FACE)) & 0xF
+
+def packed_at_least(a, b):
+    """
+    The guard bit of each field is set where a has at least as many of that face as b
+    """
+    return ((a | GUARDS) - b) & GUARDS
+
+def packed_contains(a, b):
+    """
+    Whether every die of b is in a
+    
+    >>> packed_contains(pack((1, 1, 5)), pack((1, 5)))
+    True
+    >>> packed_contains(pack((1, 5)), pack((1, 1)))
+    False
+    """
+    return packed_at_least(a, b) == GUARDS
+
+def packed_difference(a, b):
+    """
+    The dice of a that are not in b
+    
+    >>> unpack(packed_difference(pack((1, 2, 3, 3)), pack((2, 3, 4))))
+    (1, 3)
+    """
+    # where a has fewer than b, take it all away
+    return a - packed_intersection(a, b)
+
+def packed_intersection(a, b):
+    """
+    The dice in both a and b
+    
+    >>> unpack(packed_intersection(pack((1, 2, 3, 3)), pack((2, 3, 3, 4))))
+    (2, 3, 3)
+    """
+    # a 111 mask on the fields where a has at least as many as b, b is the smaller there
+    b_smaller = (packed_at_least(a, b) >> 3) * MAX_PACKED_COUNT
+    return (b & b_smaller) | (a & ~b_smaller & FIELDS)
+
 def intersection(a, b):
     """
     Find the intersection of two iterables
     
+    Rolls of dice are intersected as packed codes (see pack), other iterables with Counters. Either way
+    the result is sorted
+    
     >>> intersection((1,2,3), (2,3,4))
     (2, 3)
     
@@ -78,10 +242,13 @@ def intersection(a, b):
     >>> intersection((1,2,3,3), (2,3,4,4))
     (2, 3)
     
-    >>> intersection((1,2,3,3), (2,3,4,4))
+    >>> intersection((3,3,2,1), (2,3,4,4))
     (2, 3)
     """
-    return tuple(n for n, count in (Counter(a) & Counter(b)).items() for _ in range(count))
+    try:
+        return unpack(packed_intersection(pack(a), pack(b)))
+    except (ValueError, TypeError):
+        return tuple(sorted(n for n, count in (Counter(a) & Counter(b)).items() for _ in range(count)))
 
 def difference(a, b):
     """
@@ -89,6 +256,8 @@ def difference(a, b):
     
     "Which of a are not in b?"
     
+    Like intersection, rolls are packed and the result is sorted
+    
     >>> difference((1,2,3), (2,3,4))
     (1,)
     
@@ -98,7 +267,10 @@ def difference(a, b):
     >>> difference((1,2,3,3), (2,3,4,4))
     (1, 3)
     """
-    return tuple(n for n, count in (Counter(a) - Counter(b)).items() for _ in range(count))
+    try:
+        return unpack(packed_difference(pack(a), pack(b)))
+    except (ValueError, TypeError):
+        return tuple(sorted(n for n, count in (Counter(a) - Counter(b)).items() for _ in range(count)))
 
 def difference_symmetric(a, b):
     """